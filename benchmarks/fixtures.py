@@ -0,0 +1,146 @@
+"""
+Synthetic Spotify API payloads, shaped like the real responses
+"""
+
+from datetime import datetime, timedelta, timezone
+
+MARKETS = ["AD", "AR", "AT", "AU", "BE", "BR", "CA", "CH", "DE", "DK", "ES", "FI"]
+EPOCH = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+def _id(kind: str, i: int) -> str:
+    return f"{kind}{i:0>20}"[:22]
+
+
+def _urls(kind: str, id: str) -> dict:
+    return {"spotify": f"https://open.spotify.com/{kind}/{id}"}
+
+
+def images(seed: str) -> list:
+    return [
+        {"width": size, "height": size, "url": f"https://i.scdn.co/image/{seed}{size}"}
+        for size in (640, 300, 64)
+    ]
+
+
+def artist(i: int, full: bool = False) -> dict:
+    id = _id("ar", i)
+
+    data = {
+        "id": id,
+        "uri": f"spotify:artist:{id}",
+        "name": f"Artist {i}",
+        "type": "artist",
+        "href": f"https://api.spotify.com/v1/artists/{id}",
+        "external_urls": _urls("artist", id),
+    }
+
+    if full:
+        data["images"] = images(id)
+        data["genres"] = ["house", "techno"]
+        data["popularity"] = i % 100
+        data["followers"] = {"href": None, "total": i * 7}
+
+    return data
+
+
+def album(i: int, n_artists: int) -> dict:
+    id = _id("al", i)
+
+    return {
+        "id": id,
+        "uri": f"spotify:album:{id}",
+        "name": f"Album {i}",
+        "type": "album",
+        "album_type": "album",
+        "href": f"https://api.spotify.com/v1/albums/{id}",
+        "artists": [artist(i % n_artists)],
+        "images": images(id),
+        "release_date": f"{2000 + i % 20}-{1 + i % 12:02}-{1 + i % 28:02}",
+        "release_date_precision": "day",
+        "total_tracks": 10 + i % 5,
+        "available_markets": MARKETS,
+        "external_urls": _urls("album", id),
+    }
+
+
+def track(i: int, n_artists: int = 1000, n_albums: int = 2000) -> dict:
+    id = _id("tr", i)
+
+    return {
+        "id": id,
+        "uri": f"spotify:track:{id}",
+        "name": f"Track {i}",
+        "type": "track",
+        "href": f"https://api.spotify.com/v1/tracks/{id}",
+        "artists": [artist(i % n_artists), artist((i * 7) % n_artists)],
+        "album": album(i % n_albums, n_artists),
+        "duration_ms": 180000 + i % 60000,
+        "explicit": False,
+        "popularity": i % 100,
+        "track_number": 1 + i % 10,
+        "disc_number": 1,
+        "is_local": False,
+        "available_markets": MARKETS,
+        "external_ids": {"isrc": f"US{i:010}"},
+        "external_urls": _urls("track", id),
+    }
+
+
+def list_track(i: int, added_at: datetime = None, **kwargs) -> dict:
+    added_at = added_at or EPOCH + timedelta(hours=i)
+
+    return {
+        "added_at": added_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "added_by": None,
+        "is_local": False,
+        "track": track(i, **kwargs),
+    }
+
+
+def playlist(i: int, snapshot: int = 0) -> dict:
+    id = _id("pl", i)
+
+    return {
+        "id": id,
+        "uri": f"spotify:playlist:{id}",
+        "name": f"Playlist {i}",
+        "public": True,
+        "collaborative": False,
+        "description": f"Some playlist, number {i}",
+        "primary_color": None,
+        "snapshot_id": f"{id}{snapshot}",
+        "owner": {
+            "id": "owner",
+            "uri": "spotify:user:owner",
+            "display_name": "Owner",
+            "external_urls": _urls("user", "owner"),
+        },
+        "images": images(id),
+        "tracks": {"href": f"https://api.spotify.com/v1/playlists/{id}/tracks"},
+        "external_urls": _urls("playlist", id),
+    }
+
+
+def library(n_tracks: int, n_artists: int = None, n_albums: int = None) -> list:
+    n_artists = n_artists or max(1, n_tracks // 20)
+    n_albums = n_albums or max(1, n_tracks // 8)
+
+    return [
+        list_track(i, n_artists=n_artists, n_albums=n_albums) for i in range(n_tracks)
+    ]
+
+
+def page(items: list, offset: int, limit: int, total: int = None) -> dict:
+    total = len(items) if total is None else total
+
+    return {
+        "href": "",
+        "items": items[offset : offset + limit],
+        "limit": limit,
+        "offset": offset,
+        "total": total,
+        "next": None if offset + limit >= total else "next",
+        "previous": None if not offset else "previous",
+    }
+
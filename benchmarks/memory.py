@@ -0,0 +1,78 @@
+"""
+Memory held by a loaded library, with and without tracks, albums and
+artists being shared through models.identity
+
+    python -m benchmarks.memory --tracks 50000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from spotify import ListTrack, models
+from spotify.records import build
+
+from . import fixtures
+
+
+def load(pages, lean) -> float:
+    gc.collect()
+    tracemalloc.start()
+
+    start = time.perf_counter()
+
+    # only the built objects are kept, the decoded pages go as we go
+    tracks = [
+        build(ListTrack, item, lean) for raw in pages for item in json.loads(raw)["items"]
+    ]
+
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del tracks
+
+    return held, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=50000)
+    parser.add_argument("--artists", type=int, default=None)
+    parser.add_argument("--albums", type=int, default=None)
+    args = parser.parse_args()
+
+    items = fixtures.library(args.tracks, args.artists, args.albums)
+    pages = [
+        json.dumps(fixtures.page(items, offset, 50)).encode()
+        for offset in range(0, len(items), 50)
+    ]
+    del items
+
+    print(f"{args.tracks} tracks, sizes under tracemalloc\n")
+    print(f"{'objects':<10} {'shared':<7} {'MiB':>8} {'B/track':>8} {'seconds':>8} {'saved':>7}")
+
+    for lean in (False, True):
+        baseline = None
+
+        for enabled in (False, True):
+            models.identity.enabled = enabled
+
+            held, elapsed = load(pages, lean)
+            baseline = baseline or held
+
+            print(
+                f"{'records' if lean else 'pydantic':<10} {'yes' if enabled else 'no':<7} "
+                f"{held / 2**20:>8.1f} {held / args.tracks:>8.0f} {elapsed:>8.2f} "
+                f"{1 - held / baseline:>6.0%}"
+            )
+
+    models.identity.enabled = True
+
+
+if __name__ == "__main__":
+    main()
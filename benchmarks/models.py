@@ -0,0 +1,66 @@
+"""
+Throughput of turning saved-track pages into objects, pydantic models vs the
+lean records, with each available JSON decoder
+
+    python -m benchmarks.models --tracks 20000
+"""
+
+import argparse
+import json
+import time
+
+from spotify import ListTrack
+from spotify.records import build
+
+from . import fixtures
+
+DECODERS = {"json": json.loads}
+
+try:
+    import orjson
+
+    DECODERS["orjson"] = orjson.loads
+except ImportError:
+    pass
+
+
+def run(pages, loads, lean) -> float:
+    start = time.perf_counter()
+
+    for raw in pages:
+        for item in loads(raw)["items"]:
+            build(ListTrack, item, lean)
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    items = fixtures.library(args.tracks)
+    pages = [
+        json.dumps(fixtures.page(items, offset, 50)).encode()
+        for offset in range(0, len(items), 50)
+    ]
+
+    print(f"{args.tracks} tracks in {len(pages)} pages, best of {args.rounds}\n")
+    print(f"{'decoder':<8} {'objects':<8} {'seconds':>8} {'items/s':>10} {'speedup':>8}")
+
+    baseline = None
+
+    for name, loads in DECODERS.items():
+        for lean in (False, True):
+            best = min(run(pages, loads, lean) for _ in range(args.rounds))
+            baseline = baseline or best
+
+            print(
+                f"{name:<8} {'records' if lean else 'pydantic':<8} {best:>8.3f} "
+                f"{args.tracks / best:>10.0f} {baseline / best:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
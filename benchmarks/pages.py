@@ -0,0 +1,97 @@
+"""
+Synthetic 1001tracklists pages, with just enough of the real markup around
+the bits we scrape to weigh about the same
+"""
+
+import random
+
+from typing import Iterable
+
+
+def _chrome(body: str) -> str:
+    nav = "".join(
+        f'<li class="navItem"><a href="/genre/{i}/index.html">Genre {i}</a></li>'
+        for i in range(60)
+    )
+    scripts = "".join(
+        f'<script type="text/javascript">var cfg{i} = {{"a": {i}, "b": "{"x" * 200}"}};</script>'
+        for i in range(20)
+    )
+
+    return (
+        "<!DOCTYPE html><html><head><title>1001Tracklists</title>"
+        f"{scripts}</head><body><div id=\"header\"><ul>{nav}</ul></div>"
+        f"{body}"
+        f'<div id="footer"><ul>{nav}</ul></div></body></html>'
+    )
+
+
+def _overview_item(i: int) -> str:
+    return (
+        f'<div class="bItm action oItm" data-id="tl{i:0>8}">'
+        '<div class="bCont"><div class="bImg"><img src="/images/cover.jpg"></div>'
+        f'<div class="bTitle"><a href="/tracklist/tl{i:0>8}/set-{i}.html">Set {i}</a></div>'
+        f'<div class="bInfo"><span>{i % 300} plays</span><span>2022-01-01</span></div>'
+        "</div></div>"
+    )
+
+
+def overview_items(ids: Iterable[int]) -> str:
+    return "".join(_overview_item(i) for i in ids)
+
+
+def overview(start: int, count: int) -> str:
+    return overview_items(range(start, start + count))
+
+
+def dj_page(dj_id: str, items: int = 30, ids: Iterable[int] = None) -> str:
+    left = (
+        '<div id="left"><div class="sideTop">'
+        f'<a href="/dj/someone/index.html">Profile</a>'
+        f'<a href="https://1001.tl/{dj_id}">Short link</a>'
+        "</div></div>"
+    )
+
+    items = overview_items(range(items) if ids is None else ids)
+
+    return _chrome(f'{left}<div id="middle">{items}</div>')
+
+
+def _media_row(i: int, spotify: bool, item: int) -> str:
+    buttons = (
+        '<i class="fa fa-youtube mAction" onclick="new MediaViewer(this, '
+        f"'tlp_{i}', {{idObject: 13, idItem: {item}, viewSource: 1}} );\"></i>"
+    )
+
+    if spotify:
+        buttons += (
+            '<i class="fa fa-spotify mAction" onclick="new MediaViewer(this, '
+            f"'tlp_{i}', {{idObject: 5, idItem: {item}, viewSource: 1, viewItem: {item * 7}}} );\"></i>"
+        )
+
+    return (
+        f'<div class="tlpTog bItm tlpItem" id="tlp_{i}">'
+        f'<div class="bPlay"><span class="trackValue">{i:0>2}</span></div>'
+        f'<div class="bTitle"><span class="trackFormat">Artist {i} - Track {i}</span>'
+        '<span class="label">LABEL</span></div>'
+        f'<div class="mediaRow">{buttons}</div>'
+        "</div>"
+    )
+
+
+def tracklist(tracks: int = 40, seed: int = 0, pool: int = None) -> str:
+    # with a pool, tracks are drawn from that many, so sets share some
+    rng = random.Random(seed)
+
+    rows = "".join(
+        _media_row(i, rng.random() < 0.8, rng.randrange(pool) if pool else i)
+        for i in range(tracks)
+    )
+    comments = "".join(
+        f'<div class="comment"><p>{"great set " * 20}</p></div>' for _ in range(30)
+    )
+
+    return _chrome(
+        f'<div id="left"></div><div id="middle"><div id="tlTab">{rows}</div>'
+        f"{comments}</div>"
+    )
@@ -0,0 +1,525 @@
+"""
+A local stand-in for the parts of the Spotify Web API the spotify package
+uses, serving a synthetic account built from fixtures. Playlists and the
+library change as they are written to, snapshot ids included, so a second
+run sees what the first one did.
+
+Latency and 429s can be injected, and what was asked of it is counted per
+endpoint under /_stats.
+
+    python -m benchmarks.spotify_server --tracks 10000 --playlists 50
+
+then point update.py at it with SPOTIFY_API_URL. The token refresh goes to
+accounts.spotify.com and not through the api client, see update_run.py for
+how to send that here as well.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+from . import fixtures
+
+USER = {
+    "id": "owner",
+    "uri": "spotify:user:owner",
+    "display_name": "Owner",
+    "external_urls": {"spotify": "https://open.spotify.com/user/owner"},
+}
+
+
+def _stamp(when: datetime) -> str:
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _index(id_or_uri: str) -> int:
+    # fixtures ids are the kind and the zero padded index
+    return int(id_or_uri.rsplit(":", 1)[-1][2:])
+
+
+def parse_fields(spec: str) -> dict:
+    # "items(track(id,uri)),total" -> {"items": {"track": {"id": {}, "uri": {}}}, "total": {}}
+    tree: dict = {}
+    stack = []
+    current = tree
+    name = ""
+
+    for ch in spec:
+        if ch == "(":
+            current[name] = {}
+            stack.append(current)
+            current = current[name]
+            name = ""
+
+        elif ch in ",)":
+            if name:
+                current[name] = {}
+
+            name = ""
+
+            if ch == ")":
+                current = stack.pop()
+
+        else:
+            name += ch
+
+    if name:
+        current[name] = {}
+
+    return tree
+
+
+def pick(data, tree: dict):
+    if not tree:
+        return data
+
+    if isinstance(data, list):
+        return [pick(item, tree) for item in data]
+
+    if isinstance(data, dict):
+        return {name: pick(data[name], sub) for name, sub in tree.items() if name in data}
+
+    return data
+
+
+class Account:
+    """
+    Everything the synthetic user has. Tracks are kept as fixture indexes
+    and only rendered when asked for, so a big library stays small here.
+    """
+
+    def __init__(
+        self,
+        tracks: int = 10000,
+        playlists: int = 50,
+        playlist_tracks: int = 100,
+        idk_every: int = 10,
+        albums: int = None,
+        artists: int = 200,
+        seed: int = 0,
+    ):
+        rand = random.Random(seed)
+        now = datetime.now(timezone.utc)
+
+        self.n_artists = max(1, tracks // 20)
+        self.n_albums = max(1, tracks // 8)
+
+        # newest first, like spotify hands them out
+        self.saved: List[Tuple[int, str]] = [
+            (i, _stamp(fixtures.EPOCH + timedelta(hours=i))) for i in reversed(range(tracks))
+        ]
+
+        self.albums = list(range(min(self.n_albums, albums or max(1, tracks // 20))))
+        self.artists = list(range(min(self.n_artists, artists)))
+
+        self.playlists: Dict[str, dict] = {}
+
+        for p in range(playlists):
+            idk = idk_every and p % idk_every == 0
+
+            entries = []
+
+            for _ in range(playlist_tracks):
+                i = rand.randrange(tracks * 2)
+
+                # half of an idk playlist is recent enough to be left alone
+                if idk and rand.random() < 0.5:
+                    added_at = now - timedelta(days=rand.randint(1, 10))
+                else:
+                    added_at = fixtures.EPOCH + timedelta(hours=rand.randrange(tracks))
+
+                entries.append((i, _stamp(added_at)))
+
+            self._add_playlist(p, f"idk {p}" if idk else f"Playlist {p}", entries)
+
+        # the mirror of the saved tracks, a little out of date
+        oldest_first = self.saved[::-1]
+
+        self.mirror = self._add_playlist(
+            playlists,
+            "Saved Songs",
+            [entry for n, entry in enumerate(oldest_first) if n % 50]
+            + [(tracks + n, _stamp(now)) for n in range(10)],
+        )
+
+    def _add_playlist(self, p: int, name: str, entries: list) -> str:
+        data = fixtures.playlist(p)
+        data["name"] = name
+
+        self.playlists[data["id"]] = {"index": p, "data": data, "snapshot": 0, "tracks": entries}
+
+        return data["id"]
+
+    def track(self, i: int) -> dict:
+        return fixtures.track(i, self.n_artists, self.n_albums)
+
+    def list_track(self, entry: Tuple[int, str]) -> dict:
+        i, added_at = entry
+
+        return {
+            "added_at": added_at,
+            "added_by": None,
+            "is_local": False,
+            "track": self.track(i),
+        }
+
+    def playlist(self, id: str) -> dict:
+        playlist = self.playlists[id]
+
+        return {
+            **playlist["data"],
+            "snapshot_id": f"{id}{playlist['snapshot']}",
+            "owner": USER,
+            "tracks": {
+                "href": playlist["data"]["tracks"]["href"],
+                "total": len(playlist["tracks"]),
+            },
+        }
+
+    def changed(self, id: str) -> str:
+        self.playlists[id]["snapshot"] += 1
+        return self.playlist(id)["snapshot_id"]
+
+
+def _paging(request: web.Request, default: int = 20, most: int = 50) -> Tuple[int, int]:
+    limit = min(int(request.query.get("limit", default)), most)
+    offset = int(request.query.get("offset", 0))
+
+    return offset, limit
+
+
+def _page(request: web.Request, items: list, offset: int, limit: int) -> dict:
+    page = fixtures.page(items, offset, limit, len(items))
+    page["href"] = str(request.url)
+    return page
+
+
+class MockSpotify:
+    def __init__(
+        self,
+        account: Account,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit: float = 0.0,
+        retry_after: float = 0.1,
+        seed: int = 0,
+    ):
+        self.account = account
+
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+
+        self._rand = random.Random(seed)
+
+        # "GET /v1/me/tracks" -> requests, 429s and bytes sent
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+
+        app.router.add_post("/api/token", self.token)
+        app.router.add_get("/_stats", self.get_stats)
+
+        app.router.add_get("/v1/me", self.me)
+        app.router.add_get("/v1/me/tracks", self.saved_tracks)
+        app.router.add_put("/v1/me/tracks", self.save_tracks)
+        app.router.add_get("/v1/me/albums", self.saved_albums)
+        app.router.add_get("/v1/me/following", self.following)
+        app.router.add_get("/v1/me/playlists", self.my_playlists)
+        app.router.add_get("/v1/tracks", self.several_tracks)
+        app.router.add_get("/v1/playlists/{id}", self.get_playlist)
+        app.router.add_get("/v1/playlists/{id}/tracks", self.playlist_tracks)
+        app.router.add_post("/v1/playlists/{id}/tracks", self.add_tracks)
+        app.router.add_put("/v1/playlists/{id}/tracks", self.put_tracks)
+        app.router.add_delete("/v1/playlists/{id}/tracks", self.remove_tracks)
+
+        return app
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if not request.path.startswith("/v1/"):
+            return await handler(request)
+
+        route = request.match_info.route.resource
+        stats = self.stats[f"{request.method} {route.canonical if route else request.path}"]
+        stats["requests"] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._rand.uniform(0, self.jitter))
+
+        if self.rate_limit and self._rand.random() < self.rate_limit:
+            stats["429s"] += 1
+
+            return web.json_response(
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        response = await handler(request)
+        stats["bytes"] += len(response.body or b"")
+
+        return response
+
+    async def token(self, request: web.Request):
+        return web.json_response(
+            {
+                "access_token": "mock",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "scope": "",
+            }
+        )
+
+    async def get_stats(self, request: web.Request):
+        return web.json_response(self.stats)
+
+    def _json(self, request: web.Request, data: dict) -> web.Response:
+        if "fields" in request.query:
+            data = pick(data, parse_fields(request.query["fields"]))
+
+        return web.json_response(data)
+
+    def _playlist(self, request: web.Request) -> dict:
+        try:
+            return self.account.playlists[request.match_info["id"]]
+        except KeyError:
+            raise web.HTTPNotFound()
+
+    async def me(self, request: web.Request):
+        return web.json_response(USER)
+
+    async def saved_tracks(self, request: web.Request):
+        offset, limit = _paging(request)
+        saved = self.account.saved
+
+        page = _page(request, saved, offset, limit)
+        page["items"] = [self.account.list_track(entry) for entry in page["items"]]
+
+        return web.json_response(page)
+
+    async def save_tracks(self, request: web.Request):
+        known = {i for i, _ in self.account.saved}
+        now = _stamp(datetime.now(timezone.utc))
+
+        for id in request.query["ids"].split(","):
+            if _index(id) not in known:
+                self.account.saved.insert(0, (_index(id), now))
+
+        return web.Response()
+
+    async def saved_albums(self, request: web.Request):
+        offset, limit = _paging(request)
+        account = self.account
+
+        page = _page(request, account.albums, offset, limit)
+        page["items"] = [
+            {"added_at": _stamp(fixtures.EPOCH), "album": fixtures.album(i, account.n_artists)}
+            for i in page["items"]
+        ]
+
+        return web.json_response(page)
+
+    async def following(self, request: web.Request):
+        limit = min(int(request.query.get("limit", 20)), 50)
+        after = request.query.get("after", "0")
+
+        # the cursor is the id of the last artist handed out
+        start = 0 if after == "0" else _index(after) + 1
+        items = [fixtures.artist(i, True) for i in self.account.artists[start : start + limit]]
+
+        return web.json_response(
+            {
+                "artists": {
+                    "href": str(request.url),
+                    "items": items,
+                    "limit": limit,
+                    "total": len(self.account.artists),
+                    "next": None,
+                    "cursors": {"after": items[-1]["id"] if items else None},
+                }
+            }
+        )
+
+    async def my_playlists(self, request: web.Request):
+        offset, limit = _paging(request)
+        ids = list(self.account.playlists)
+
+        page = _page(request, ids, offset, limit)
+        page["items"] = [self.account.playlist(id) for id in page["items"]]
+
+        return web.json_response(page)
+
+    async def several_tracks(self, request: web.Request):
+        ids = request.query["ids"].split(",")[:50]
+
+        return web.json_response(
+            {"tracks": [self.account.track(_index(id)) for id in ids]}
+        )
+
+    async def get_playlist(self, request: web.Request):
+        self._playlist(request)
+
+        return self._json(request, self.account.playlist(request.match_info["id"]))
+
+    async def playlist_tracks(self, request: web.Request):
+        playlist = self._playlist(request)
+        offset, limit = _paging(request, 100, 100)
+
+        page = _page(request, playlist["tracks"], offset, limit)
+        page["items"] = [self.account.list_track(entry) for entry in page["items"]]
+
+        return self._json(request, page)
+
+    async def add_tracks(self, request: web.Request):
+        playlist = self._playlist(request)
+        body = await request.json()
+
+        now = _stamp(datetime.now(timezone.utc))
+        entries = [(_index(uri), now) for uri in body["uris"]]
+
+        position = body.get("position")
+        position = len(playlist["tracks"]) if position is None else position
+
+        playlist["tracks"][position:position] = entries
+
+        return web.json_response(
+            {"snapshot_id": self.account.changed(request.match_info["id"])}, status=201
+        )
+
+    async def put_tracks(self, request: web.Request):
+        playlist = self._playlist(request)
+        body = await request.json()
+
+        if "uris" in body:
+            now = _stamp(datetime.now(timezone.utc))
+            playlist["tracks"] = [(_index(uri), now) for uri in body["uris"]]
+
+        else:
+            tracks = playlist["tracks"]
+
+            start = body["range_start"]
+            length = body.get("range_length", 1)
+            before = body["insert_before"]
+
+            moved = tracks[start : start + length]
+            del tracks[start : start + length]
+
+            if before > start:
+                before -= length
+
+            tracks[before:before] = moved
+
+        return web.json_response({"snapshot_id": self.account.changed(request.match_info["id"])})
+
+    async def remove_tracks(self, request: web.Request):
+        playlist = self._playlist(request)
+        body = await request.json()
+
+        gone = {_index(track["uri"]) for track in body["tracks"]}
+        playlist["tracks"] = [entry for entry in playlist["tracks"] if entry[0] not in gone]
+
+        return web.json_response({"snapshot_id": self.account.changed(request.match_info["id"])})
+
+
+async def _serve(mock: MockSpotify, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(mock.app(), access_log=None)
+    await runner.setup()
+
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    return runner
+
+
+def _run(conn, account: dict, options: dict):
+    async def serve():
+        mock = MockSpotify(Account(**account), **options)
+        runner = await _serve(mock, "127.0.0.1", 0)
+
+        port = runner.addresses[0][1]
+        conn.send((f"http://127.0.0.1:{port}", mock.account.mirror))
+
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start(account: dict = None, **options) -> Tuple[multiprocessing.Process, str, str]:
+    """
+    Runs the mock in a process of its own, so that it neither shares the
+    event loop with nor gets billed to whatever is being measured. Hands back
+    the process, the base url and the id of the mirror playlist.
+    """
+    parent, child = multiprocessing.Pipe()
+
+    process = multiprocessing.Process(
+        target=_run, args=(child, account or {}, options), daemon=True
+    )
+    process.start()
+
+    url, mirror = parent.recv()
+
+    return process, url, mirror
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--tracks", type=int, default=10000)
+    parser.add_argument("--playlists", type=int, default=50)
+    parser.add_argument("--playlist-tracks", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this much more")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of requests that get a 429")
+    parser.add_argument("--retry-after", type=float, default=0.1)
+
+
+def from_arguments(args: argparse.Namespace) -> Tuple[dict, dict]:
+    account = {
+        "tracks": args.tracks,
+        "playlists": args.playlists,
+        "playlist_tracks": args.playlist_tracks,
+    }
+    options = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "rate_limit": args.rate_limit,
+        "retry_after": args.retry_after,
+    }
+
+    return account, options
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    account, options = from_arguments(args)
+
+    async def serve():
+        mock = MockSpotify(Account(**account), **options)
+        await _serve(mock, "127.0.0.1", args.port)
+
+        print(f"SPOTIFY_API_URL=http://127.0.0.1:{args.port}/v1")
+        print(f"SPOTIFY_MIRROR_PLAYLIST={mock.account.mirror}")
+
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Sorting a playlist and making its CSV rows, on a list of tracks vs a
+TrackTable
+
+    python -m benchmarks.table --tracks 100000
+"""
+
+import argparse
+import gc
+import random
+import time
+
+from spotify import ListTrack, TrackTable
+from spotify.records import build
+
+from . import fixtures
+
+
+def timed(func) -> float:
+    # like timeit, keep the collector from billing one side for the other's
+    # garbage
+    gc.collect()
+    gc.disable()
+
+    try:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def row(track):
+    return [
+        track.track.name,
+        track.track.album.name,
+        ", ".join(artist.name for artist in track.track.artists),
+        track.track.id,
+        track.track.url,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    items = fixtures.library(args.tracks)
+    random.Random(0).shuffle(items)
+
+    tracks = [build(ListTrack, item, True) for item in items]
+    del items
+
+    table = TrackTable.from_tracks(tracks)
+
+    passes = {
+        "sort": (
+            lambda: sorted(tracks, key=lambda x: (x.added_at, x.track.name)),
+            lambda: table.order(),
+        ),
+        "csv rows": (
+            lambda: [row(t) for t in tracks],
+            lambda: list(table.csv_rows()),
+        ),
+    }
+
+    print(f"{args.tracks} tracks, best of {args.rounds}\n")
+    print(f"{'pass':<12} {'list ms':>8} {'table ms':>9} {'speedup':>8}")
+
+    for name, (listed, tabled) in passes.items():
+        a = min(timed(listed) for _ in range(args.rounds))
+        b = min(timed(tabled) for _ in range(args.rounds))
+
+        print(f"{name:<12} {a * 1000:>8.1f} {b * 1000:>9.1f} {a / b:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
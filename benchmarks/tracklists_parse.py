@@ -0,0 +1,98 @@
+"""
+Time to parse a 1001tracklists page, building the whole tree vs only the
+parts we read, with each available parser, and how many pages a second the
+parse pool gets through
+
+    python -m benchmarks.tracklists_parse --pages 200
+"""
+
+import argparse
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+import tracklists
+
+from . import pages
+
+PARSERS = ["html.parser"]
+
+try:
+    import lxml  # noqa: F401
+
+    PARSERS.append("lxml")
+except ImportError:
+    pass
+
+
+def full(html, parser):
+    return BeautifulSoup(html, parser).find_all(class_="mediaRow")
+
+
+def strained(html, parser):
+    return BeautifulSoup(html, parser, parse_only=tracklists.MEDIA_ROWS).find_all(
+        class_="mediaRow"
+    )
+
+
+def run(docs, func, parser) -> float:
+    start = time.perf_counter()
+
+    for html in docs:
+        func(html, parser)
+
+    return time.perf_counter() - start
+
+
+def run_pool(docs, workers) -> float:
+    with ProcessPoolExecutor(workers) as pool:
+        # spin the workers up before we start counting
+        list(pool.map(tracklists.parse_media, docs[:workers]))
+
+        start = time.perf_counter()
+        list(pool.map(tracklists.parse_media, docs))
+
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--tracks", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=tracklists.PARSE_WORKERS)
+    args = parser.parse_args()
+
+    docs = [pages.tracklist(args.tracks, seed) for seed in range(args.pages)]
+    size = sum(map(len, docs)) // len(docs)
+
+    print(
+        f"{args.pages} pages of {args.tracks} tracks (~{size // 1024} KiB), "
+        f"best of {args.rounds}\n"
+    )
+    print(f"{'tree':<10} {'parser':<12} {'ms/page':>8} {'speedup':>8}")
+
+    baseline = None
+
+    for parser_name in PARSERS:
+        for func in (full, strained):
+            best = min(run(docs, func, parser_name) for _ in range(args.rounds))
+            baseline = baseline or best
+
+            print(
+                f"{func.__name__:<10} {parser_name:<12} "
+                f"{best / args.pages * 1000:>8.2f} {baseline / best:>7.1f}x"
+            )
+
+    print(f"\nparse_media ({tracklists.HTML_PARSER}) through the pool")
+    print(f"{'workers':<8} {'pages/s':>8}")
+
+    for workers in sorted({1, args.workers}):
+        best = min(run_pool(docs, workers) for _ in range(args.rounds))
+        print(f"{workers:<8} {args.pages / best:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+tracklists.py end to end against the mock 1001tracklists site and the mock
+Spotify API. The first run crawls every DJ from scratch, the ones after it
+see --new sets published in between, with the medialink cache and
+watermarks left from before.
+
+    python -m benchmarks.tracklists_run --djs 3 --sets 100 --rate 20
+
+Reports tracklists and medialinks a second, the CPU the parse pool spent per
+page, and how the time of every request splits between waiting on the
+politeness limit (and the jitter after it) and actually fetching.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from collections import Counter
+from urllib.request import Request, urlopen
+
+from . import spotify_server, tracklists_server
+
+TRACKLIST = "GET /tracklist/{id}/{slug}"
+MEDIALINK = "GET /ajax/get_medialink.php"
+
+
+def _children_cpu() -> float:
+    # the parse pool, once it has been shut down and reaped
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _self_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _get(url: str, method: str = "GET") -> dict:
+    with urlopen(Request(url, method=method)) as response:
+        return json.load(response)
+
+
+def _requests(after: dict, before: dict, route: str) -> int:
+    count = lambda stats: stats.get(route, {}).get("requests", 0)
+    return count(after) - count(before)
+
+
+@contextlib.contextmanager
+def instrumented(tracklists, totals: Counter):
+    # class level, Core makes its own Session and Tracklists
+    pace = tracklists.Session._pace
+    request = tracklists.Session._request
+    parse = tracklists.Tracklists._parse
+
+    async def timed_pace(self, url):
+        start = time.perf_counter()
+
+        try:
+            return await pace(self, url)
+        finally:
+            totals["pace"] += time.perf_counter() - start
+
+    async def timed_request(self, *args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return await request(self, *args, **kwargs)
+        finally:
+            totals["request"] += time.perf_counter() - start
+            totals["requests"] += 1
+
+    async def timed_parse(self, func, html):
+        start = time.perf_counter()
+
+        try:
+            return await parse(self, func, html)
+        finally:
+            totals["parse"] += time.perf_counter() - start
+            totals["parses"] += 1
+            totals[f"parse {func.__name__}"] += 1
+
+    tracklists.Session._pace = timed_pace
+    tracklists.Session._request = timed_request
+    tracklists.Tracklists._parse = timed_parse
+
+    try:
+        yield
+    finally:
+        tracklists.Session._pace = pace
+        tracklists.Session._request = request
+        tracklists.Tracklists._parse = parse
+
+
+def report(
+    title: str,
+    totals: Counter,
+    wall: float,
+    cpu: float,
+    pool_cpu: float,
+    tl: int,
+    ml: int,
+    rate: float,
+    steady_rate: float,
+):
+    requests = totals["requests"] or 1
+    parses = totals["parses"] or 1
+
+    print(f"\n{title}\n")
+    print(f"{'wall':<28} {wall:>9.2f} s")
+    print(f"{'tracklists':<28} {tl:>9} {tl / wall:>8.2f}/s")
+    print(f"{'medialinks':<28} {ml:>9} {ml / wall:>8.2f}/s")
+    print(
+        f"{'requests to 1001tracklists':<28} {totals['requests']:>9.0f} "
+        f"{totals['requests'] / wall:>8.2f}/s"
+    )
+    print(f"{'  at most, by the limit':<28} {'':>9} {rate:>8.2f}/s")
+    print(f"{'  with the jitter, on average':<28} {'':>9} {steady_rate:>8.2f}/s")
+
+    print(f"\n{'per request':<28} {'ms':>9} {'share':>9}")
+    fetch = totals["request"] - totals["pace"]
+
+    for name, value in (("waiting (limit + jitter)", totals["pace"]), ("fetching", fetch)):
+        print(
+            f"{name:<28} {value / requests * 1000:>9.1f} "
+            f"{value / (totals['request'] or 1):>9.0%}"
+        )
+
+    print(f"\n{'parsing':<28} {'pages':>9} {'ms/page':>9}")
+    for name in ("parse_dj_page", "parse_overview", "parse_media"):
+        print(f"{name:<28} {totals[f'parse {name}']:>9.0f}")
+
+    print(
+        f"{'  round trip through pool':<28} {'':>9} "
+        f"{totals['parse'] / parses * 1000:>9.1f}"
+    )
+    print(f"{'  pool cpu':<28} {'':>9} {pool_cpu / parses * 1000:>9.1f}")
+
+    print(f"\n{'cpu on the loop':<28} {cpu:>9.2f} s {cpu / wall:>8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    tracklists_server.add_arguments(parser)
+    parser.add_argument("--rate", type=float, default=20.0, help="TRACKLISTS_RATE")
+    parser.add_argument("--burst", type=int, default=1, help="TRACKLISTS_BURST")
+    parser.add_argument("--pace-jitter", type=float, default=0.3, help="TRACKLISTS_JITTER")
+    parser.add_argument("--dj-concurrency", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=2, help="PARSE_WORKERS")
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--new", type=int, default=5, help="sets published between runs")
+    parser.add_argument("--profile", action="store_true", help="run tracklists.py with --profile")
+    args = parser.parse_args()
+
+    tl_process, tl_url = tracklists_server.start(**tracklists_server.from_arguments(args))
+
+    # one playlist per DJ, the tracks are whatever the medialinks point at
+    sp_process, sp_url, _ = spotify_server.start(
+        {"tracks": args.pool, "playlists": args.djs, "playlist_tracks": 50, "idk_every": 0}
+    )
+
+    root = tempfile.mkdtemp(prefix="dews-bench-")
+
+    os.environ.update(
+        SPOTIFY_CLIENT_ID="bench",
+        SPOTIFY_CLIENT_SECRET="bench",
+        SPOTIFY_REDIRECT_URI="http://localhost",
+        SPOTIFY_REFRESH_TOKEN="bench",
+        SPOTIFY_API_URL=f"{sp_url}/v1",
+        TRACKLISTS_URL=tl_url,
+        TRACKLISTS_RATE=str(args.rate),
+        TRACKLISTS_BURST=str(args.burst),
+        TRACKLISTS_JITTER=str(args.pace_jitter),
+        DJ_CONCURRENCY=str(args.dj_concurrency),
+        PARSE_WORKERS=str(args.workers),
+        CACHE_DIR=root,
+    )
+
+    # tracklists reads its settings on import
+    import tracklists
+
+    from async_spotify.api._endpoints.urls import URLS
+
+    from . import fixtures
+
+    # the token refresh doesn't go through the api client
+    URLS.REFRESH = f"{sp_url}/api/token"
+
+    tracklists.log.setLevel(logging.WARNING)
+
+    # what the session's bucket actually holds to
+    pace = tracklists.TokenBucket(args.rate, args.burst, args.pace_jitter)
+
+    tracklists.DJs = tuple(
+        tracklists.DJ(tracklists_server.dj_name(n), fixtures._id("pl", n))
+        for n in range(args.djs)
+    )
+
+    print(
+        f"{args.djs} DJs with {args.sets} sets of {args.set_tracks} tracks, "
+        f"{args.rate}/s burst {args.burst} jitter {args.pace_jitter}, "
+        f"{args.workers} parse worker(s), "
+        f"{args.latency * 1000:.0f}ms latency"
+    )
+
+    try:
+        for run in range(args.runs):
+            if run:
+                _get(f"{tl_url}/_publish?count={args.new}", "POST")
+
+            totals: Counter = Counter()
+
+            before = _get(f"{tl_url}/_stats")
+            cpu, pool_cpu = _self_cpu(), _children_cpu()
+
+            async def scrape():
+                app = tracklists.Core(profile=args.profile)
+
+                try:
+                    await app.run()
+                finally:
+                    await app.close()
+
+            with instrumented(tracklists, totals):
+                start = time.perf_counter()
+                asyncio.run(scrape())
+                wall = time.perf_counter() - start
+
+            after = _get(f"{tl_url}/_stats")
+
+            report(
+                f"run {run + 1} ({'cold' if run == 0 else f'{args.new} new sets'})",
+                totals,
+                wall,
+                _self_cpu() - cpu,
+                _children_cpu() - pool_cpu,
+                _requests(after, before, TRACKLIST),
+                _requests(after, before, MEDIALINK),
+                args.rate,
+                pace.steady_rate,
+            )
+
+    finally:
+        tl_process.terminate()
+        sp_process.terminate()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
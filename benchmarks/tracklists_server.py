@@ -0,0 +1,231 @@
+"""
+A local stand-in for the bits of 1001tracklists that tracklists.py scrapes:
+DJ pages, the ajax/get_data.php overview, tracklist pages and
+ajax/get_medialink.php, all built from pages.py. Medialinks resolve to
+fixtures track ids, so the spotify side can be served by spotify_server.py.
+
+Every DJ has a run of sets, newest first. POST /_publish puts more in front
+of them, like a DJ posting new sets between runs. Latency can be injected,
+and requests are counted per route under /_stats.
+
+    python -m benchmarks.tracklists_server --djs 3 --sets 100
+
+then point tracklists.py at it with TRACKLISTS_URL.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+from . import fixtures, pages
+
+# sets per DJ page and per overview request
+PAGE_SIZE = 30
+
+# set ids are numbered from here for each DJ
+DJ_STRIDE = 1_000_000
+
+
+def dj_name(n: int) -> str:
+    return f"dj{n}"
+
+
+class MockTracklists:
+    def __init__(
+        self,
+        djs: int = 3,
+        sets: int = 100,
+        tracks: int = 40,
+        pool: int = 2000,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0,
+    ):
+        self.tracks = tracks
+        self.pool = pool
+
+        self.latency = latency
+        self.jitter = jitter
+
+        self._rand = random.Random(seed)
+
+        # the set ids of every DJ, newest first
+        self.sets: Dict[str, List[int]] = {
+            dj_name(n): [n * DJ_STRIDE + i for i in reversed(range(sets))]
+            for n in range(djs)
+        }
+
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+
+        app.router.add_get("/_stats", self.get_stats)
+        app.router.add_post("/_publish", self.publish)
+
+        app.router.add_get("/", self.home)
+        app.router.add_get("/dj/{name}/", self.dj)
+        app.router.add_post("/ajax/get_data.php", self.get_data)
+        app.router.add_get("/ajax/get_medialink.php", self.get_medialink)
+        app.router.add_get("/tracklist/{id}/{slug}", self.tracklist)
+
+        return app
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path.startswith("/_"):
+            return await handler(request)
+
+        route = request.match_info.route.resource
+        stats = self.stats[f"{request.method} {route.canonical if route else request.path}"]
+        stats["requests"] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._rand.uniform(0, self.jitter))
+
+        response = await handler(request)
+        stats["bytes"] += len(response.body or b"")
+
+        return response
+
+    async def get_stats(self, request: web.Request):
+        return web.json_response(self.stats)
+
+    async def publish(self, request: web.Request):
+        count = int(request.query.get("count", 1))
+
+        for n, sets in enumerate(self.sets.values()):
+            newest = max(sets, default=n * DJ_STRIDE - 1)
+            sets[:0] = reversed(range(newest + 1, newest + 1 + count))
+
+        return web.json_response({"published": count})
+
+    async def home(self, request: web.Request):
+        response = web.Response(
+            text="<html><body>1001Tracklists</body></html>", content_type="text/html"
+        )
+        response.set_cookie("guid", "mock")
+        return response
+
+    async def dj(self, request: web.Request):
+        name = request.match_info["name"]
+
+        if name not in self.sets:
+            raise web.HTTPNotFound()
+
+        return web.Response(
+            text=pages.dj_page(f"id{name}", ids=self.sets[name][:PAGE_SIZE]),
+            content_type="text/html",
+        )
+
+    async def get_data(self, request: web.Request):
+        form = await request.post()
+
+        # the short link on the DJ page is id + name
+        sets = self.sets[form["dj"][2:]]
+        pos = int(form["pos"])
+
+        if pos >= len(sets):
+            return web.json_response({"success": False, "end": True})
+
+        return web.json_response(
+            {"success": True, "data": pages.overview_items(sets[pos : pos + PAGE_SIZE])}
+        )
+
+    async def tracklist(self, request: web.Request):
+        seed = int(request.match_info["id"][2:])
+
+        return web.Response(
+            text=pages.tracklist(self.tracks, seed, self.pool), content_type="text/html"
+        )
+
+    async def get_medialink(self, request: web.Request):
+        item = int(request.query["idItem"])
+
+        return web.json_response(
+            {"success": True, "data": [{"playerId": fixtures._id("tr", item)}]}
+        )
+
+
+async def _serve(mock: MockTracklists, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(mock.app(), access_log=None)
+    await runner.setup()
+
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    return runner
+
+
+def _run(conn, options: dict):
+    async def serve():
+        runner = await _serve(MockTracklists(**options), "127.0.0.1", 0)
+
+        conn.send(f"http://127.0.0.1:{runner.addresses[0][1]}")
+
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start(**options) -> Tuple[multiprocessing.Process, str]:
+    """
+    Runs the mock in a process of its own and hands back the process and
+    the base url.
+    """
+    parent, child = multiprocessing.Pipe()
+
+    process = multiprocessing.Process(target=_run, args=(child, options), daemon=True)
+    process.start()
+
+    return process, parent.recv()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--djs", type=int, default=3)
+    parser.add_argument("--sets", type=int, default=100, help="sets per DJ")
+    parser.add_argument("--set-tracks", type=int, default=40)
+    parser.add_argument("--pool", type=int, default=2000, help="distinct tracks across all sets")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this much more")
+
+
+def from_arguments(args: argparse.Namespace) -> dict:
+    return {
+        "djs": args.djs,
+        "sets": args.sets,
+        "tracks": args.set_tracks,
+        "pool": args.pool,
+        "latency": args.latency,
+        "jitter": args.jitter,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    async def serve():
+        await _serve(MockTracklists(**from_arguments(args)), "127.0.0.1", args.port)
+
+        print(f"TRACKLISTS_URL=http://127.0.0.1:{args.port}")
+        print(f"DJs: {', '.join(dj_name(n) for n in range(args.djs))}")
+
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
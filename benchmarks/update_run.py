@@ -0,0 +1,330 @@
+"""
+update.py end to end against the mock Spotify API, exporting into a
+throwaway git repo with a local origin. The first run starts from nothing,
+later ones reuse the cache and see what the runs before them changed.
+
+    python -m benchmarks.update_run --tracks 10000 --playlists 50 --latency 0.02
+
+For every stage of DewsBeats.main it reports when it started, the wall
+time, the CPU time of this process and of the git it spawned, the requests
+made (429s included) and the peak RSS so far. Stages run side by side, so
+the CPU of the ones that overlap is counted in each of them.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+from collections import Counter, defaultdict
+from urllib.request import urlopen
+
+from . import spotify_server
+
+
+def _cpu(who) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss() -> float:
+    # KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+OUTSIDE = "(outside any stage)"
+
+
+class Stages:
+    """
+    Times whatever is running between entering and leaving a stage. The
+    stage a request belongs to follows the task that made it, so stages
+    running side by side keep their requests apart.
+    """
+
+    def __init__(self):
+        self.order = []
+        self.stats = defaultdict(Counter)
+        self.spans = defaultdict(list)
+        self.current = contextvars.ContextVar("stage", default=None)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if name not in self.stats:
+            self.order.append(name)
+
+        token = self.current.set(name)
+        stats = self.stats[name]
+
+        wall = time.perf_counter()
+        cpu = _cpu(resource.RUSAGE_SELF)
+        git = _cpu(resource.RUSAGE_CHILDREN)
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+
+            stats["wall"] += end - wall
+            stats["cpu"] += _cpu(resource.RUSAGE_SELF) - cpu
+            stats["git"] += _cpu(resource.RUSAGE_CHILDREN) - git
+            stats["rss"] = _peak_rss()
+
+            self.spans[name].append((wall, end))
+            self.current.reset(token)
+
+    def request(self):
+        self.stats[self.current.get() or OUTSIDE]["requests"] += 1
+
+    def covered(self) -> float:
+        # wall time spent in at least one stage
+        total, reached = 0.0, None
+
+        for start, end in sorted(span for spans in self.spans.values() for span in spans):
+            if reached is not None and start < reached:
+                start = reached
+
+            if end > start:
+                total += end - start
+                reached = end if reached is None else max(reached, end)
+
+        return total
+
+    def wrap(self, obj, attr: str, name: str):
+        func = getattr(obj, attr)
+
+        if inspect.isasyncgenfunction(func):
+
+            async def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    async for item in func(*args, **kwargs):
+                        yield item
+
+        elif inspect.isgeneratorfunction(func):
+
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    yield from func(*args, **kwargs)
+
+        else:
+
+            async def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return await func(*args, **kwargs)
+
+        setattr(obj, attr, functools.wraps(func)(wrapper))
+
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_repo(root: str) -> str:
+    origin = os.path.join(root, "origin.git")
+    repo = os.path.join(root, "repo")
+
+    _git("init", "--quiet", "--bare", "--initial-branch=master", origin)
+    _git("clone", "--quiet", origin, repo)
+    _git("commit", "--quiet", "--allow-empty", "--message=init", cwd=repo)
+    _git("push", "--quiet", "origin", "master", cwd=repo)
+
+    return repo
+
+
+def instrument(d, stages: Stages):
+    # main doesn't hand out the git it makes, so catch it on the way in
+    update = inspect.getmodule(type(d))
+    git_class = update.GitImport if update.GIT_PLUMBING else update.Git
+
+    def make_git():
+        git = git_class()
+        stages.wrap(git, "pull", "git pull")
+        stages.wrap(git, "commit_and_push", "commit and push")
+        return git
+
+    stages.wrap(d.spotify, "refresh_token", "refresh token")
+    stages.wrap(d.spotify.user, "me", "user")
+    stages.wrap(d.library, "sync", "library sync")
+    stages.wrap(d.library, "iter", "library read")
+    stages.wrap(d.spotify.playlists, "current_get_all", "list playlists")
+    stages.wrap(d, "get_artists", "artists")
+    stages.wrap(d, "get_albums", "albums")
+    stages.wrap(d, "purge_idk_playlists", "purge idk")
+    stages.wrap(d, "update_playlist", "update mirror")
+    stages.wrap(d, "update_git", "export")
+
+    make_request = d.spotify.http._make_request
+
+    async def counted(*args, **kwargs):
+        stages.request()
+        return await make_request(*args, **kwargs)
+
+    d.spotify.http._make_request = counted
+
+    return {"GitImport": make_git, "Git": make_git}
+
+
+def report(
+    title: str,
+    stages: Stages,
+    started: float,
+    total: float,
+    critical: list,
+    server: dict,
+):
+    print(f"\n{title}\n")
+    print(
+        f"{'stage':<20} {'start s':>8} {'wall s':>8} {'cpu s':>7} {'git s':>7} "
+        f"{'requests':>9} {'peak MiB':>9}"
+    )
+
+    for name in sorted(stages.order, key=lambda name: stages.spans[name][0][0]):
+        s = stages.stats[name]
+        start = stages.spans[name][0][0] - started
+
+        print(
+            f"{name:<20} {start:>8.3f} {s['wall']:>8.3f} {s['cpu']:>7.3f} {s['git']:>7.3f} "
+            f"{s['requests']:>9} {s['rss']:>9.1f}"
+        )
+
+    print(
+        f"{OUTSIDE:<20} {'':>8} {total - stages.covered():>8.3f} {'':>7} {'':>7} "
+        f"{stages.stats[OUTSIDE]['requests']:>9}"
+    )
+    print(f"{'total':<20} {'':>8} {total:>8.3f}")
+
+    # as main's pipeline sees it, by its own stages rather than the ones above
+    print(f"\ncritical path: {' -> '.join(critical) or '-'}")
+
+    print(f"\n{'endpoint':<36} {'requests':>9} {'429s':>6} {'KiB out':>9}")
+
+    for endpoint, s in sorted(server.items()):
+        print(
+            f"{endpoint:<36} {s.get('requests', 0):>9} {s.get('429s', 0):>6} "
+            f"{s.get('bytes', 0) / 1024:>9.0f}"
+        )
+
+
+def _server_stats(url: str) -> dict:
+    with urlopen(f"{url}/_stats") as response:
+        return json.load(response)
+
+
+def _delta(after: dict, before: dict) -> dict:
+    return {
+        endpoint: {k: v - before.get(endpoint, {}).get(k, 0) for k, v in stats.items()}
+        for endpoint, stats in after.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    spotify_server.add_arguments(parser)
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--lean", action="store_true")
+    parser.add_argument("--plumbing", action="store_true", help="commit through git fast-import")
+    parser.add_argument("--keep", action="store_true", help="leave the repo and cache behind")
+    parser.add_argument("--profile", action="store_true", help="run update.py with --profile")
+    args = parser.parse_args()
+
+    account, options = spotify_server.from_arguments(args)
+    process, url, mirror = spotify_server.start(account, **options)
+
+    root = tempfile.mkdtemp(prefix="dews-bench-")
+
+    # git takes these straight from the environment too
+    os.environ.update(
+        GIT_COMMITTER_NAME="bench",
+        GIT_COMMITTER_EMAIL="bench@localhost",
+        GIT_AUTHOR_NAME="bench",
+        GIT_AUTHOR_EMAIL="bench@localhost",
+    )
+
+    os.environ.update(
+        SPOTIFY_CLIENT_ID="bench",
+        SPOTIFY_CLIENT_SECRET="bench",
+        SPOTIFY_REDIRECT_URI="http://localhost",
+        SPOTIFY_REFRESH_TOKEN="bench",
+        SPOTIFY_API_URL=f"{url}/v1",
+        SPOTIFY_MIRROR_PLAYLIST=mirror,
+        SPOTIFY_LEAN="1" if args.lean else "",
+        GIT_PLUMBING="1" if args.plumbing else "",
+        GIT_REPO=make_repo(root),
+        GIT_PASSWORD="",
+        CACHE_DIR=os.path.join(root, "cache"),
+    )
+
+    # update reads its settings on import
+    import update
+
+    from async_spotify.api._endpoints.urls import URLS
+
+    # the token refresh doesn't go through the api client
+    URLS.REFRESH = f"{url}/api/token"
+
+    update.log.setLevel(logging.WARNING)
+
+    print(
+        f"{args.tracks} saved tracks, {args.playlists} playlists of "
+        f"{args.playlist_tracks}, {options['latency'] * 1000:.0f}ms latency, "
+        f"{options['rate_limit']:.0%} 429s"
+    )
+
+    try:
+        for run in range(args.runs):
+            stages = Stages()
+
+            d = update.DewsBeats(profile=args.profile)
+            git_classes = instrument(d, stages)
+
+            before = _server_stats(url)
+
+            with _patched(update, git_classes):
+                start = time.perf_counter()
+                asyncio.run(d.main())
+                total = time.perf_counter() - start
+
+            report(
+                f"run {run + 1} ({'cold' if run == 0 else 'warm'})",
+                stages,
+                start,
+                total,
+                d.pipeline.critical_path(d.metrics.stages),
+                _delta(_server_stats(url), before),
+            )
+
+    finally:
+        process.terminate()
+
+        if args.keep:
+            print(f"\nleft in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def _patched(module, values: dict):
+    saved = {name: getattr(module, name) for name in values}
+
+    for name, value in values.items():
+        setattr(module, name, value)
+
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+if __name__ == "__main__":
+    main()
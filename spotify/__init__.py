@@ -1,3 +1,9 @@
 from .client import SpotifyClient
+from .governor import Governor
+from .metrics import Metrics
+from .store import LibraryStore, PlaylistStore
+from .diff import PlaylistDiff
+from .projection import Projection
+from .table import TrackTable
 
 from .models import *
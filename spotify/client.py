@@ -1,4 +1,6 @@
-from typing import List
+import json
+
+from typing import Callable, List
 
 from urllib.parse import urlparse, parse_qs
 
@@ -9,6 +11,9 @@ from async_spotify.authentification.spotify_authorization_token import (
 )
 from async_spotify.spotify_errors import SpotifyError
 
+from .http import RequestHandler
+from .governor import Governor
+from .metrics import Metrics
 from .endpoints.user import UserEndpoint
 from .endpoints.library import LibraryEndpoint
 from .endpoints.playlists import PlaylistsEndpoint
@@ -24,6 +29,11 @@ class SpotifyClient:
         scopes: List[str],
         redirect_uri: str,
         refresh_token: str = None,
+        lean: bool = False,
+        json_loads: Callable = json.loads,
+        governor: Governor = None,
+        base_url: str = None,
+        metrics: Metrics = None,
     ) -> None:
         self._refresh_token = refresh_token
 
@@ -35,12 +45,15 @@ class SpotifyClient:
         )
 
         self.api = SpotifyApiClient(auth, hold_authentication=True)
-
-        self.user = UserEndpoint(self.api)
-        self.library = LibraryEndpoint(self.api)
-        self.playlists = PlaylistsEndpoint(self.api)
-        self.follow = FollowEndpoint(self.api)
-        self.track = TrackEndpoint(self.api)
+        self.http = RequestHandler(self.api, json_loads, governor, base_url, metrics)
+        self.metrics = self.http.metrics
+
+        # lean endpoints hand out records.py objects instead of models
+        self.user = UserEndpoint(self.api, lean)
+        self.library = LibraryEndpoint(self.api, lean)
+        self.playlists = PlaylistsEndpoint(self.api, lean)
+        self.follow = FollowEndpoint(self.api, lean)
+        self.track = TrackEndpoint(self.api, lean)
 
     async def _update_refresh_token(self):
         authorization_url: str = self.api.build_authorization_url(show_dialog=True)
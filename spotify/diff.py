@@ -0,0 +1,189 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Iterable, List, NamedTuple, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .endpoints.playlists import PlaylistsEndpoint
+
+
+BATCH_SIZE = 100
+
+
+class Move(NamedTuple):
+    start: int
+    before: int
+    length: int
+
+
+class Insert(NamedTuple):
+    position: Optional[int]  # None appends
+    uris: List[str]
+
+
+def _batches(n: int) -> int:
+    return -(-n // BATCH_SIZE)
+
+
+def _stable(ranks: List[int]) -> set:
+    """Indices of a longest increasing run in ranks, ie. what can stay put"""
+    tails: List[int] = []
+    tail_idx: List[int] = []
+    prev = [-1] * len(ranks)
+
+    for i, rank in enumerate(ranks):
+        j = bisect_left(tails, rank)
+
+        if j == len(tails):
+            tails.append(rank)
+            tail_idx.append(i)
+        else:
+            tails[j] = rank
+            tail_idx[j] = i
+
+        prev[i] = tail_idx[j - 1] if j else -1
+
+    keep = set()
+    i = tail_idx[-1] if tail_idx else -1
+
+    while i != -1:
+        keep.add(i)
+        i = prev[i]
+
+    return keep
+
+
+class PlaylistDiff:
+    """
+    Plan for turning the current contents of a playlist into the desired
+    ordered list of uris with as few API calls as possible.
+
+    Removing by uri drops every copy of it, so duplicates are removed and
+    added back at the right spot. When the remove/reorder/insert plan costs
+    more calls than rewriting the playlist outright, `replace` is used instead.
+    """
+
+    def __init__(self, desired: Iterable[str], current: Iterable[str]) -> None:
+        self.desired: List[str] = list(dict.fromkeys(desired))
+        current = list(current)
+
+        rank = {uri: i for i, uri in enumerate(self.desired)}
+        counts = Counter(current)
+
+        self.remove: List[str] = [
+            uri for uri in counts if uri not in rank or counts[uri] > 1
+        ]
+
+        # what the playlist looks like once the removals went through
+        kept = [uri for uri in current if uri in rank and counts[uri] == 1]
+        kept_set = set(kept)
+
+        self.replace: Optional[List[str]] = None
+        self.moves: List[Move] = self._plan_moves(
+            kept, [uri for uri in self.desired if uri in kept_set], rank
+        )
+        self.inserts: List[Insert] = self._plan_inserts(kept_set)
+
+        if self.moves is None or self._patch_calls() > self._replace_calls():
+            self.replace = self.desired
+            self.moves = []
+
+    def _replace_calls(self) -> int:
+        return max(1, _batches(len(self.desired)))
+
+    def _patch_calls(self) -> int:
+        return (
+            _batches(len(self.remove))
+            + len(self.moves)
+            + sum(_batches(len(i.uris)) for i in self.inserts)
+        )
+
+    def _plan_moves(self, kept: List[str], target: List[str], rank: dict):
+        stable = _stable([rank[uri] for uri in kept])
+        stays = {kept[i] for i in stable}
+
+        moves: List[Move] = []
+        budget = self._replace_calls()
+
+        cur = list(kept)
+        i = 0
+
+        while i < len(target):
+            if target[i] in stays:
+                i += 1
+                continue
+
+            # every move is O(n), so give up once rewriting is already cheaper
+            if len(moves) >= budget:
+                return None
+
+            start = cur.index(target[i])
+
+            # grab any following items that are already in the right order
+            length = 1
+            while (
+                i + length < len(target)
+                and target[i + length] not in stays
+                and start + length < len(cur)
+                and cur[start + length] == target[i + length]
+            ):
+                length += 1
+
+            before = cur.index(target[i - 1]) + 1 if i else 0
+
+            if not start <= before <= start + length:
+                moves.append(Move(start, before, length))
+
+                block = cur[start : start + length]
+                del cur[start : start + length]
+
+                at = before if before < start else before - length
+                cur[at:at] = block
+
+            i += length
+
+        return moves
+
+    def _plan_inserts(self, kept: set) -> List[Insert]:
+        inserts: List[Insert] = []
+        run: List[str] = []
+
+        for i, uri in enumerate(self.desired):
+            if uri not in kept:
+                run.append(uri)
+                continue
+
+            if run:
+                inserts.append(Insert(i - len(run), run))
+                run = []
+
+        if run:
+            inserts.append(Insert(None, run))
+
+        return inserts
+
+    @property
+    def calls(self) -> int:
+        if self.replace is not None:
+            return self._replace_calls()
+
+        return self._patch_calls()
+
+    def __bool__(self) -> bool:
+        return self.calls > 0
+
+    async def apply(self, playlists: "PlaylistsEndpoint", playlist_id: str):
+        if self.replace is not None:
+            await playlists.replace_tracks(playlist_id, self.replace)
+            return
+
+        await playlists.remove_tracks(playlist_id, self.remove)
+
+        for move in self.moves:
+            await playlists.reorder_tracks(
+                playlist_id, move.start, move.before, move.length
+            )
+
+        for insert in self.inserts:
+            await playlists.add_tracks(
+                playlist_id, insert.uris, position=insert.position
+            )
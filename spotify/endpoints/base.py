@@ -1,9 +1,19 @@
 from typing import TYPE_CHECKING
 
+from ..records import build
+
 if TYPE_CHECKING:
     from async_spotify import SpotifyApiClient
+    from ..projection import Projection
 
 
 class Endpoint:
-    def __init__(self, api: "SpotifyApiClient"):
+    def __init__(self, api: "SpotifyApiClient", lean: bool = False):
         self._api = api
+        self._lean = lean
+
+    def _build(self, model, data: dict, projection: "Projection" = None):
+        if projection:
+            return projection.model(**data)
+
+        return build(model, data, self._lean)
@@ -22,7 +22,7 @@ class FollowEndpoint(Endpoint):
                 break
 
             for i in req["items"]:
-                artist = Artist(**i)
+                artist = self._build(Artist, i)
 
                 yield artist
 
@@ -1,19 +1,30 @@
-from typing import AsyncIterator
+from typing import AsyncIterator, List, Tuple
 
 from .base import Endpoint
 from ..models import ListTrack, Album
-from ..utils import Paginator, Chunker
+from ..projection import Projection
+from ..utils import Paginator, Batcher
 
 
 class LibraryEndpoint(Endpoint):
-    async def get_tracks(self, **kwargs) -> AsyncIterator[ListTrack]:
+    async def get_tracks(
+        self, projection: Projection = None, **kwargs
+    ) -> AsyncIterator[ListTrack]:
+        # no fields filter here, but we can still skip building the rest
         async for i in Paginator(self._api.library.get_tracks, **kwargs):
-            yield ListTrack(**i)
+            yield self._build(ListTrack, i, projection)
+
+    async def head(self, limit: int = Paginator.API_LIMIT) -> Tuple[int, List[str]]:
+        # how many there are and the ids of the newest few, in one request
+        req = await self._api.library.get_tracks(limit=limit)
+        return req["total"], [i["track"]["id"] for i in req["items"]]
 
     async def get_albums(self, **kwargs) -> AsyncIterator[Album]:
         async for i in Paginator(self._api.library.get_albums, **kwargs):
-            yield Album(**i["album"])
+            yield self._build(Album, i["album"])
 
     async def add_tracks(self, track_id_list, **kwargs):
-        for chunk in Chunker(track_id_list, 50):
-            await self._api.library.add_tracks(chunk, **kwargs)
+        # one after the other, saved tracks are ordered by when they landed
+        await Batcher(track_id_list, 50).run(
+            lambda chunk: self._api.library.add_tracks(chunk, **kwargs)
+        )
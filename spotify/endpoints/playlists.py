@@ -1,29 +1,86 @@
 from typing import AsyncIterator
 
+from async_spotify.api._endpoints.urls import URLS
+
 from .base import Endpoint
 from ..models import Playlist, ListTrack
-from ..utils import Paginator, Chunker
+from ..projection import Projection
+from ..utils import Paginator, Batcher
 
 
 class PlaylistsEndpoint(Endpoint):
     async def current_get_all(self, **kwargs) -> AsyncIterator[Playlist]:
         async for i in Paginator(self._api.playlists.current_get_all, **kwargs):
-            yield Playlist(**i)
+            yield self._build(Playlist, i)
+
+    async def get_tracks(
+        self, *args, projection: Projection = None, **kwargs
+    ) -> AsyncIterator[ListTrack]:
+        if projection:
+            # we need the id to skip local files
+            kwargs["fields"] = projection.extend("track.id").fields()
 
-    async def get_tracks(self, *args, **kwargs) -> AsyncIterator[ListTrack]:
         async for i in Paginator(self._api.playlists.get_tracks, *args, **kwargs):
             if "track" in i and i["track"]["id"] is None:
                 continue
 
-            yield ListTrack(**i)
+            yield self._build(ListTrack, i, projection)
 
-    async def add_tracks(self, playlist_id, spotify_uris, **kwargs):
-        for chunk in Chunker(spotify_uris, 100):
-            await self._api.playlists.add_tracks(playlist_id, chunk, **kwargs)
+    async def add_tracks(
+        self, playlist_id, spotify_uris, position=None, timeout=None, **kwargs
+    ):
+        async def add(chunk):
+            nonlocal position
 
-    async def remove_tracks(self, playlist_id, spotify_uris, **kwargs):
-        for chunk in Chunker(spotify_uris, 100):
-            uris = list(map(lambda x: {"uri": x}, chunk))
-            await self._api.playlists.remove_tracks(
-                playlist_id, {"tracks": uris}, **kwargs
+            await self._api.playlists.add_tracks(
+                playlist_id, chunk, position=position, **kwargs
             )
+
+            # keep later chunks after the ones we just inserted
+            if position is not None:
+                position += len(chunk)
+
+        # each chunk has to land after the last one, so strictly one at a time
+        await Batcher(spotify_uris, 100, timeout).run(add)
+
+    async def replace_tracks(self, playlist_id, spotify_uris, **kwargs):
+        await self._api.playlists.replace_tracks(playlist_id, spotify_uris[:100], **kwargs)
+        await self.add_tracks(playlist_id, spotify_uris[100:], **kwargs)
+
+    async def reorder_tracks(
+        self, playlist_id, range_start, insert_before, range_length=1, **kwargs
+    ):
+        await self._api.playlists.reorder_tracks(
+            playlist_id,
+            {
+                "range_start": range_start,
+                "insert_before": insert_before,
+                "range_length": range_length,
+            },
+            **kwargs,
+        )
+
+    async def remove_tracks(
+        self, playlist_id, spotify_uris, concurrency=1, **kwargs
+    ) -> str:
+        # async_spotify's remove_tracks drops the response, and with it the
+        # snapshot id, so make the request ourselves
+        url = URLS.PLAYLIST.ADD_TRACKS.format(playlist_id=playlist_id)
+        snapshot_id = None
+
+        # removing by uri doesn't care about order
+        async for req in Batcher(spotify_uris, 100).map(
+            lambda chunk: self._api._api_request_handler.make_request(
+                "DELETE",
+                url,
+                {},
+                kwargs.get("auth_token"),
+                body={"tracks": [{"uri": x} for x in chunk]},
+            ),
+            concurrency,
+        ):
+            # every removal hands back the snapshot it left the playlist at.
+            # one at a time the last one is where it ended up
+            snapshot_id = req["snapshot_id"]
+
+        return snapshot_id
@@ -2,13 +2,15 @@ from typing import AsyncIterator
 
 from .base import Endpoint
 from ..models import Track
-from ..utils import Chunker
+from ..utils import Batcher
 
 
 class TrackEndpoint(Endpoint):
-    async def get_several(self, track_id_list, **kwargs) -> AsyncIterator[Track]:
-        for chunk in Chunker(track_id_list, 50):
-            data = await self._api.track.get_several(chunk, **kwargs)
-
+    async def get_several(
+        self, track_id_list, concurrency: int = 1, **kwargs
+    ) -> AsyncIterator[Track]:
+        async for data in Batcher(track_id_list, 50).map(
+            lambda chunk: self._api.track.get_several(chunk, **kwargs), concurrency
+        ):
             for track in data["tracks"]:
-                yield Track(**track)
+                yield self._build(Track, track)
@@ -4,7 +4,7 @@ from ..models import User
 
 class UserEndpoint(Endpoint):
     async def get_one(self, user_id: str) -> User:
-        return User(**(await self._api.user.get_one(user_id)))
+        return self._build(User, await self._api.user.get_one(user_id))
 
     async def me(self):
-        return User(**(await self._api.user.me()))
+        return self._build(User, await self._api.user.me())
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+
+class Governor:
+    """
+    Shared gate that every request to Spotify has to pass through.
+
+    The number of requests allowed in flight grows by one for every window
+    worth of successful requests and is halved whenever Spotify pushes back
+    (AIMD). A 429 also holds back every request until its Retry-After is up.
+    """
+
+    def __init__(self, window: int = 4, min_window: int = 1, max_window: int = 32):
+        self.window: float = float(window)
+        self.min_window = min_window
+        self.max_window = max_window
+
+        self.in_flight: int = 0
+
+        self._resume_at: float = 0.0
+        self._condition: asyncio.Condition = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # created on first use so it belongs to the running loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        return self._condition
+
+    async def acquire(self):
+        async with self.condition:
+            while True:
+                wait = self._resume_at - time.monotonic()
+
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self.condition.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+
+                elif self.in_flight < int(self.window):
+                    break
+
+                else:
+                    await self.condition.wait()
+
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def succeeded(self):
+        self.window = min(self.max_window, self.window + 1 / self.window)
+
+    def congested(self, retry_after: float = 0):
+        now = time.monotonic()
+
+        # everything that was in flight when we got pushed back will probably
+        # fail the same way, only count it once
+        if now >= self._resume_at:
+            self.window = max(self.min_window, self.window / 2)
+
+        self._resume_at = max(self._resume_at, now + retry_after)
@@ -0,0 +1,240 @@
+import json
+import time
+import asyncio
+
+from typing import Callable
+from urllib.parse import urlparse
+
+import backoff
+
+from aiohttp import ClientError
+from async_spotify import SpotifyApiClient
+from async_spotify._error_message import ErrorMessage
+from async_spotify.api._response_status import ResponseStatus
+from async_spotify.authentification.spotify_authorization_token import (
+    SpotifyAuthorisationToken,
+)
+from async_spotify.spotify_errors import (
+    SpotifyError,
+    TokenExpired,
+    RateLimitExceeded,
+    SpotifyAPIError,
+)
+
+from .governor import Governor
+from .metrics import Metrics, endpoint, page_items
+
+
+class ServerError(SpotifyAPIError):
+    """5xx from spotify, usually gone if you ask again"""
+
+
+# a 429 only ever costs us the wait, so we can afford to be patient with it
+RATE_LIMIT_TRIES = 10
+
+# how long to hold off after a 429 that came without a Retry-After, doubled
+# for every one in a row
+RATE_LIMIT_WAIT = 1.0
+RATE_LIMIT_MAX_WAIT = 30.0
+
+TRANSIENT_TRIES = 5
+TRANSIENT_ERRORS = (ServerError, ClientError, asyncio.TimeoutError)
+
+# what can be sent again after a timeout or a 5xx. a POST that timed out may
+# well have gone through, and adding the tracks twice is worse than failing
+IDEMPOTENT = {"GET", "PUT", "DELETE"}
+
+# where async_spotify sends everything
+API_URL = "https://api.spotify.com/v1"
+
+
+def _idempotent(method: str, body) -> bool:
+    # moving a range of tracks is a PUT too, but twice moves it twice
+    return method in IDEMPOTENT and not (isinstance(body, dict) and "range_start" in body)
+
+
+def _retried(details: dict):
+    # backoff hands us what make_request was called with
+    handler, method, url = details["args"][:3]
+    handler.metrics.retried(handler._endpoint(method, url), "error")
+
+
+class RequestHandler:
+    """
+    Takes over async_spotify's make_request so that we decide how every
+    request to the API is made: how the response gets decoded, and how fast
+    we go, pacing everything through the governor and retrying 429s, and
+    transient errors for whatever is safe to send twice.
+    """
+
+    def __init__(
+        self,
+        api: SpotifyApiClient,
+        loads: Callable = json.loads,
+        governor: Governor = None,
+        base_url: str = None,
+        metrics: Metrics = None,
+    ) -> None:
+        self._api = api
+        self._handler = api._api_request_handler
+
+        self.loads = loads
+        self.governor = governor or Governor()
+        self.metrics = metrics or Metrics()
+
+        # point the client at something other than the real API, like the
+        # mock in benchmarks
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+        # every async_spotify endpoint goes through this one method
+        self._handler.make_request = self.make_request
+
+    async def make_request(
+        self,
+        method: str,
+        url: str,
+        query_params: dict,
+        auth_token: SpotifyAuthorisationToken,
+        body: dict = None,
+    ):
+        args = (method, url, query_params, auth_token, body)
+
+        if _idempotent(method, body):
+            return await self._retried_request(*args)
+
+        return await self._request(*args)
+
+    @backoff.on_exception(
+        backoff.expo,
+        TRANSIENT_ERRORS,
+        max_tries=TRANSIENT_TRIES,
+        jitter=backoff.full_jitter,
+        on_backoff=_retried,
+    )
+    async def _retried_request(self, *args):
+        return await self._request(*args)
+
+    async def _request(self, *args):
+        for attempt in range(RATE_LIMIT_TRIES - 1):
+            # only for when spotify doesn't say how long to wait
+            wait = min(RATE_LIMIT_WAIT * 2**attempt, RATE_LIMIT_MAX_WAIT)
+
+            try:
+                return await self._governed_request(*args, rate_limit_wait=wait)
+            except RateLimitExceeded:
+                # the governor holds us back until retry-after is up
+                self.metrics.retried(self._endpoint(*args[:2]), "rate_limit")
+                continue
+
+        return await self._governed_request(*args)
+
+    async def _governed_request(self, *args, rate_limit_wait: float = 0):
+        async with self.governor:
+            try:
+                response = await self._make_request(*args)
+
+            except RateLimitExceeded as e:
+                self.governor.congested(e.retry_after or rate_limit_wait)
+                raise
+
+            except TRANSIENT_ERRORS:
+                self.governor.congested()
+                raise
+
+            self.governor.succeeded()
+
+            return response
+
+    def _endpoint(self, method: str, url: str) -> str:
+        return endpoint(method, urlparse(url).path)
+
+    async def _make_request(
+        self,
+        method: str,
+        url: str,
+        query_params: dict,
+        auth_token: SpotifyAuthorisationToken,
+        body: dict = None,
+        last_try: bool = False,
+    ):
+        handler = self._handler
+
+        if not handler.client_session_list:
+            message = (
+                "You have to create a new client with create_new_client "
+                "before you can make requests to the spotify api."
+            )
+            raise SpotifyError(ErrorMessage(message=message).__dict__)
+
+        url_params, headers, data = handler._prepare_request_parameters(
+            auth_token, query_params, body
+        )
+
+        name = self._endpoint(method, url)
+
+        if self.base_url and url.startswith(API_URL):
+            url = self.base_url + url[len(API_URL) :]
+
+        handler.client_session_list.rotate(1)
+        client = handler.client_session_list[0]
+
+        start = time.perf_counter()
+
+        try:
+            async with client.request(
+                method, url, params=url_params, headers=headers, data=data
+            ) as response:
+                status = ResponseStatus(response.status)
+                retry_after = response.headers.get("Retry-After", None)
+
+                raw = await response.read()
+
+        except TRANSIENT_ERRORS as e:
+            self.metrics.observe(name, type(e).__name__, time.perf_counter() - start, 0)
+            raise
+
+        elapsed = time.perf_counter() - start
+
+        try:
+            response_json = self.loads(raw)
+        except ValueError:
+            response_json = {}
+
+        self.metrics.observe(
+            name,
+            status.code,
+            elapsed,
+            len(raw),
+            page_items(response_json) if status.success else None,
+        )
+
+        if status.code == 401:
+            if handler.token_renew_instance and not last_try:
+                auth_token = await handler.token_renew_instance(self._api)
+
+                if handler.spotify_authorisation_token.valid:
+                    handler.spotify_authorisation_token.access_token = auth_token.access_token
+                    handler.spotify_authorisation_token.activation_time = auth_token.activation_time
+                    handler.spotify_authorisation_token.refresh_token = auth_token.refresh_token
+
+                return await self._make_request(
+                    method, url, query_params, auth_token, body, last_try=True
+                )
+
+            raise TokenExpired(response_json)
+
+        if status.code == 429:
+            try:
+                retry_after = float(retry_after)
+            except (TypeError, ValueError):
+                retry_after = 0
+
+            raise RateLimitExceeded(message=response_json, retry_after=retry_after)
+
+        if status.code >= 500:
+            raise ServerError(response_json)
+
+        if not status.success:
+            raise SpotifyAPIError(response_json)
+
+        return response_json
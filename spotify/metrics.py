@@ -0,0 +1,224 @@
+import re
+import time
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# upper bounds of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# playlist, track, album, etc. ids
+RE_ID = re.compile(r"^[0-9A-Za-z]{22}$")
+
+
+def endpoint(method: str, path: str) -> str:
+    # GET /playlists/{id}/tracks for GET /v1/playlists/37i9dQZF1DXcBWIGoYBM5M/tracks
+    parts = path.split("?", 1)[0].strip("/").split("/")
+
+    if parts and parts[0] == "v1":
+        parts = parts[1:]
+
+    # user ids can look like anything
+    parts = [
+        "{id}" if RE_ID.match(part) or (i and parts[i - 1] == "users") else part
+        for i, part in enumerate(parts)
+    ]
+
+    return f"{method} /{'/'.join(parts)}"
+
+
+def page_items(response) -> Optional[int]:
+    # how many things a page held, if it was a page of things
+    if not isinstance(response, dict):
+        return None
+
+    if isinstance(response.get("items"), list):
+        return len(response["items"])
+
+    # followed artists come wrapped in a page, several tracks as a plain list
+    if len(response) == 1:
+        (value,) = response.values()
+
+        if isinstance(value, dict) and isinstance(value.get("items"), list):
+            return len(value["items"])
+
+        if isinstance(value, list):
+            return len(value)
+
+    return None
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.statuses: Counter = Counter()
+        self.retries: Counter = Counter()
+
+        self.seconds = 0.0
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+
+        self.bytes = 0
+        self.pages = 0
+        self.items = 0
+
+    def observe(self, status, seconds: float, size: int, items: Optional[int]):
+        self.requests += 1
+        self.statuses[str(status)] += 1
+
+        self.seconds += seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+        self.bytes += size
+
+        if items is not None:
+            self.pages += 1
+            self.items += items
+
+    def report(self) -> dict:
+        return {
+            "requests": self.requests,
+            "statuses": dict(self.statuses),
+            "retries": dict(self.retries),
+            "seconds": round(self.seconds, 6),
+            "latency_buckets": dict(
+                zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.buckets)
+            ),
+            "bytes": self.bytes,
+            "pages": self.pages,
+            "items": self.items,
+            "items_per_page": round(self.items / self.pages, 2) if self.pages else None,
+        }
+
+
+class Metrics:
+    """
+    What a run did: every request to the API tagged by endpoint, and how
+    long each stage took. The request handler feeds it, report() and
+    prometheus() hand it out.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self._clock = time.perf_counter()
+
+        self.endpoints: Dict[str, EndpointStats] = defaultdict(EndpointStats)
+
+        # name -> start and end, in seconds since the run started
+        self.stages: Dict[str, List[float]] = {}
+
+        self.ok: Optional[bool] = None
+        self.seconds: Optional[float] = None
+
+    def observe(self, endpoint: str, status, seconds: float, size: int, items: int = None):
+        self.endpoints[endpoint].observe(status, seconds, size, items)
+
+    def retried(self, endpoint: str, reason: str):
+        self.endpoints[endpoint].retries[reason] += 1
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._clock
+
+    def finish(self, ok: bool):
+        self.ok = ok
+        self.seconds = self._now()
+
+    def _seconds(self) -> float:
+        return round(self._now() if self.seconds is None else self.seconds, 6)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = self._now()
+
+        try:
+            yield
+        finally:
+            self.stages[name] = [start, self._now()]
+
+    def report(self, **extra) -> dict:
+        return {
+            "started": self.started,
+            "seconds": self._seconds(),
+            "ok": self.ok,
+            **extra,
+            "stages": {
+                name: {
+                    "start": round(start, 6),
+                    "seconds": round(end - start, 6),
+                }
+                # stages can overlap, so they're done in whatever order
+                for name, (start, end) in sorted(
+                    self.stages.items(), key=lambda stage: stage[1][0]
+                )
+            },
+            "endpoints": {
+                name: stats.report() for name, stats in sorted(self.endpoints.items())
+            },
+        }
+
+    def prometheus(self, prefix: str = "dews", **labels) -> str:
+        """The same as report(), in the Prometheus text format"""
+        base = "".join(f',{k}="{v}"' for k, v in labels.items())
+        lines = []
+
+        def metric(name: str, kind: str, help: str):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def sample(name: str, value, **tags):
+            tags = (",".join(f'{k}="{v}"' for k, v in tags.items()) + base).lstrip(",")
+            tags = f"{{{tags}}}" if tags else ""
+
+            lines.append(f"{prefix}_{name}{tags} {value}")
+
+        metric("run_started_seconds", "gauge", "When the run started")
+        sample("run_started_seconds", self.started)
+
+        metric("run_seconds", "gauge", "How long the run took")
+        sample("run_seconds", self._seconds())
+
+        if self.ok is not None:
+            metric("run_success", "gauge", "Whether the run went through")
+            sample("run_success", int(self.ok))
+
+        metric("stage_seconds", "gauge", "How long each stage took")
+        for name, (start, end) in self.stages.items():
+            sample("stage_seconds", round(end - start, 6), stage=name)
+
+        endpoints = sorted(self.endpoints.items())
+
+        metric("spotify_requests_total", "counter", "Requests to the Spotify API")
+        for name, stats in endpoints:
+            for status, count in sorted(stats.statuses.items()):
+                sample("spotify_requests_total", count, endpoint=name, status=status)
+
+        metric("spotify_retries_total", "counter", "Requests that had to be made again")
+        for name, stats in endpoints:
+            for reason, count in sorted(stats.retries.items()):
+                sample("spotify_retries_total", count, endpoint=name, reason=reason)
+
+        metric("spotify_request_seconds", "histogram", "Time taken by each request")
+        for name, stats in endpoints:
+            total = 0
+
+            for le, count in zip([*map(str, LATENCY_BUCKETS), "+Inf"], stats.buckets):
+                total += count
+                sample("spotify_request_seconds_bucket", total, endpoint=name, le=le)
+
+            sample("spotify_request_seconds_sum", round(stats.seconds, 6), endpoint=name)
+            sample("spotify_request_seconds_count", stats.requests, endpoint=name)
+
+        metric("spotify_response_bytes_total", "counter", "Bytes received")
+        for name, stats in endpoints:
+            sample("spotify_response_bytes_total", stats.bytes, endpoint=name)
+
+        metric("spotify_pages_total", "counter", "Pages received")
+        for name, stats in endpoints:
+            sample("spotify_pages_total", stats.pages, endpoint=name)
+
+        metric("spotify_page_items_total", "counter", "Items received in pages")
+        for name, stats in endpoints:
+            sample("spotify_page_items_total", stats.items, endpoint=name)
+
+        return "\n".join(lines) + "\n"
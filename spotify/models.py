@@ -1,21 +1,46 @@
+import hashlib
+
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Any, Callable, Optional, List
+from weakref import WeakValueDictionary
+
+from pydantic import VERSION as PYDANTIC_VERSION, BaseModel, HttpUrl
+
+try:
+    from orjson import OPT_SORT_KEYS, dumps as _orjson_dumps
+
+    def _dumps(data: dict) -> bytes:
+        return _orjson_dumps(data, option=OPT_SORT_KEYS)
 
-from pydantic import BaseModel, HttpUrl
+except ImportError:
+    import json
 
+    def _dumps(data: dict) -> bytes:
+        return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
 
-class SpotifyBase(BaseModel):
+
+class Shareable(BaseModel):
+    class Config:
+        # pydantic deep copies any model handed to it by default, which
+        # would undo the sharing done by IdentityMap. 1.10 wants it spelled
+        # out and warns about the bool
+        copy_on_model_validation = (
+            "none" if tuple(map(int, PYDANTIC_VERSION.split(".")[:2])) >= (1, 10) else False
+        )
+
+
+class SpotifyBase(Shareable):
     id: str
     uri: str
 
 
-class Image(BaseModel):
+class Image(Shareable):
     width: Optional[int]
     height: Optional[int]
     url: HttpUrl
 
 
-class ExternalUrls(BaseModel):
+class ExternalUrls(Shareable):
     spotify: HttpUrl
 
 
@@ -50,6 +75,7 @@ class Playlist(SpotifyBase, Url):
     public: bool
     description: str
     primary_color: Optional[str]
+    snapshot_id: str
     owner: User
     images: List[Image]
     external_urls: ExternalUrls
@@ -66,3 +92,71 @@ class ListTrack(BaseModel):
     added_at: datetime
     # added_by: User
     track: Track
+
+
+class IdentityMap:
+    """
+    Hands out one shared object per track, album and artist, so the same
+    album showing up on thousands of tracks across the library and
+    playlists is only kept in memory once.
+
+    Entries are keyed on everything they were built from, not just the id.
+    A projection only fetches some of the fields and a cached copy can be
+    older than what spotify sends now, and neither should get handed out in
+    place of the other. They're only held on to for as long as something
+    else is.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = True
+
+        self._objects: WeakValueDictionary = WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def get(self, cls: type, data: dict, make: Callable[[dict], Any]):
+        if not self.enabled:
+            return make(data)
+
+        # a digest rather than the payload itself, which would cost more
+        # than sharing saves
+        key = (cls, data["id"], hashlib.blake2b(_dumps(data), digest_size=16).digest())
+
+        obj = self._objects.get(key)
+
+        if obj is None:
+            obj = self._objects[key] = make(data)
+
+        return obj
+
+
+identity = IdentityMap()
+
+# which fields hold something worth sharing, and what it is
+SHARED_FIELDS = {
+    ListTrack: {"track": Track},
+    Track: {"album": Album, "artists": Artist},
+    Album: {"artists": Artist},
+}
+
+
+def build_shared(model, data: dict):
+    fields = SHARED_FIELDS.get(model)
+
+    if fields:
+        data = dict(data)
+
+        for name, sub in fields.items():
+            value = data.get(name)
+
+            if isinstance(value, list):
+                data[name] = [identity.get(sub, v, _builder(sub)) for v in value]
+            elif value is not None:
+                data[name] = identity.get(sub, value, _builder(sub))
+
+    return model(**data)
+
+
+def _builder(model) -> Callable[[dict], Any]:
+    return lambda data: build_shared(model, data)
@@ -0,0 +1,78 @@
+from typing import List, Optional, Type
+
+from pydantic import BaseModel, create_model
+from pydantic.fields import SHAPE_LIST
+
+from .models import Url
+
+
+class PartialUrl(BaseModel, Url):
+    pass
+
+
+def _partial(model: Type[BaseModel], tree: dict) -> Type[BaseModel]:
+    fields = {}
+
+    for name, sub in tree.items():
+        field = model.__fields__[name]
+
+        if sub:
+            type_ = _partial(field.type_, sub)
+
+            if field.shape == SHAPE_LIST:
+                type_ = List[type_]
+        else:
+            type_ = field.outer_type_
+
+        if field.allow_none:
+            type_ = Optional[type_]
+
+        fields[name] = (type_, ... if field.required else field.default)
+
+    return create_model(
+        f"{model.__name__}Partial",
+        __base__=PartialUrl if issubclass(model, Url) else BaseModel,
+        **fields,
+    )
+
+
+def _render(tree: dict) -> str:
+    return ",".join(
+        f"{name}({_render(sub)})" if sub else name for name, sub in tree.items()
+    )
+
+
+class Projection:
+    """
+    The handful of fields a caller actually needs from a model, as dotted
+    paths like "track.album.name".
+
+    Endpoints that support it pass this to Spotify as the `fields` filter, and
+    build `model` from the trimmed down response, a copy of the original
+    model with every other field left out.
+    """
+
+    def __init__(self, model: Type[BaseModel], *paths: str) -> None:
+        self.paths = tuple(dict.fromkeys(paths))
+
+        self._base = model
+        self._tree: dict = {}
+
+        for path in self.paths:
+            node = self._tree
+            for name in path.split("."):
+                node = node.setdefault(name, {})
+
+        self.model = _partial(model, self._tree)
+        self._extended = {}
+
+    def extend(self, *paths: str) -> "Projection":
+        # building the models isn't free, so hang on to them
+        if paths not in self._extended:
+            self._extended[paths] = Projection(self._base, *self.paths, *paths)
+
+        return self._extended[paths]
+
+    def fields(self, root: str = "items") -> str:
+        # the paginator relies on total to know when to stop
+        return f"{root}({_render(self._tree)}),total,next"
@@ -0,0 +1,319 @@
+"""
+Lightweight stand-ins for the models in models.py
+
+These skip validation entirely and only keep what we actually read, which
+makes building them several times cheaper than the pydantic models. They
+expose the same attributes so the two can be used interchangeably.
+"""
+
+import json
+
+from datetime import datetime
+from typing import List
+
+from . import models
+
+
+def _datetime(value: str) -> datetime:
+    # fromisoformat only learned about Z in 3.11
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _images(data: dict) -> list:
+    return [ImageRecord.from_dict(i) for i in data.get("images") or ()]
+
+
+def _artists(data: dict) -> list:
+    return [
+        models.identity.get(ArtistRecord, a, ArtistRecord.from_dict)
+        for a in data["artists"]
+    ]
+
+
+class Record:
+    # weakref so that models.identity can keep track of them
+    __slots__ = ("__weakref__",)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and all(
+            getattr(self, k) == getattr(other, k) for k in self.__slots__
+        )
+
+    @classmethod
+    def parse_raw(cls, data: str):
+        return cls.from_dict(json.loads(data))
+
+    def json(self) -> str:
+        return json.dumps(self.dict())
+
+
+class ImageRecord(Record):
+    __slots__ = ("width", "height", "url")
+
+    def __init__(self, width: int, height: int, url: str) -> None:
+        self.width = width
+        self.height = height
+        self.url = url
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ImageRecord":
+        return cls(data.get("width"), data.get("height"), data["url"])
+
+    def dict(self) -> dict:
+        return {"width": self.width, "height": self.height, "url": self.url}
+
+
+class UserRecord(Record):
+    __slots__ = ("id", "uri", "display_name")
+
+    def __init__(self, id: str, uri: str, display_name: str) -> None:
+        self.id = id
+        self.uri = uri
+        self.display_name = display_name
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserRecord":
+        return cls(data["id"], data["uri"], data.get("display_name"))
+
+    def dict(self) -> dict:
+        return {"id": self.id, "uri": self.uri, "display_name": self.display_name}
+
+
+class ArtistRecord(Record):
+    __slots__ = ("id", "uri", "name", "url", "images")
+
+    def __init__(
+        self, id: str, uri: str, name: str, url: str, images: List[ImageRecord]
+    ) -> None:
+        self.id = id
+        self.uri = uri
+        self.name = name
+        self.url = url
+        self.images = images
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ArtistRecord":
+        return cls(
+            data["id"],
+            data["uri"],
+            data["name"],
+            data["external_urls"]["spotify"],
+            _images(data),
+        )
+
+    def dict(self) -> dict:
+        return {
+            "id": self.id,
+            "uri": self.uri,
+            "name": self.name,
+            "external_urls": {"spotify": self.url},
+            "images": [i.dict() for i in self.images],
+        }
+
+
+class AlbumRecord(Record):
+    # release_date is left as spotify sends it, its precision varies anyways
+    __slots__ = (
+        "id",
+        "uri",
+        "name",
+        "url",
+        "artists",
+        "images",
+        "release_date",
+        "total_tracks",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        uri: str,
+        name: str,
+        url: str,
+        artists: List[ArtistRecord],
+        images: List[ImageRecord],
+        release_date: str,
+        total_tracks: int,
+    ) -> None:
+        self.id = id
+        self.uri = uri
+        self.name = name
+        self.url = url
+        self.artists = artists
+        self.images = images
+        self.release_date = release_date
+        self.total_tracks = total_tracks
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AlbumRecord":
+        return cls(
+            data["id"],
+            data["uri"],
+            data["name"],
+            data["external_urls"]["spotify"],
+            _artists(data),
+            _images(data),
+            data.get("release_date"),
+            data.get("total_tracks"),
+        )
+
+    def dict(self) -> dict:
+        return {
+            "id": self.id,
+            "uri": self.uri,
+            "name": self.name,
+            "external_urls": {"spotify": self.url},
+            "artists": [a.dict() for a in self.artists],
+            "images": [i.dict() for i in self.images],
+            "release_date": self.release_date,
+            "total_tracks": self.total_tracks,
+        }
+
+
+class PlaylistRecord(Record):
+    __slots__ = (
+        "id",
+        "uri",
+        "name",
+        "url",
+        "public",
+        "description",
+        "primary_color",
+        "snapshot_id",
+        "owner",
+        "images",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        uri: str,
+        name: str,
+        url: str,
+        public: bool,
+        description: str,
+        primary_color: str,
+        snapshot_id: str,
+        owner: UserRecord,
+        images: List[ImageRecord],
+    ) -> None:
+        self.id = id
+        self.uri = uri
+        self.name = name
+        self.url = url
+        self.public = public
+        self.description = description
+        self.primary_color = primary_color
+        self.snapshot_id = snapshot_id
+        self.owner = owner
+        self.images = images
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlaylistRecord":
+        return cls(
+            data["id"],
+            data["uri"],
+            data["name"],
+            data["external_urls"]["spotify"],
+            data["public"],
+            data["description"],
+            data.get("primary_color"),
+            data["snapshot_id"],
+            UserRecord.from_dict(data["owner"]),
+            _images(data),
+        )
+
+    def dict(self) -> dict:
+        return {
+            "id": self.id,
+            "uri": self.uri,
+            "name": self.name,
+            "external_urls": {"spotify": self.url},
+            "public": self.public,
+            "description": self.description,
+            "primary_color": self.primary_color,
+            "snapshot_id": self.snapshot_id,
+            "owner": self.owner.dict(),
+            "images": [i.dict() for i in self.images],
+        }
+
+
+class TrackRecord(Record):
+    __slots__ = ("id", "uri", "name", "url", "artists", "album")
+
+    def __init__(
+        self,
+        id: str,
+        uri: str,
+        name: str,
+        url: str,
+        artists: List[ArtistRecord],
+        album: AlbumRecord,
+    ) -> None:
+        self.id = id
+        self.uri = uri
+        self.name = name
+        self.url = url
+        self.artists = artists
+        self.album = album
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TrackRecord":
+        return cls(
+            data["id"],
+            data["uri"],
+            data["name"],
+            data["external_urls"]["spotify"],
+            _artists(data),
+            models.identity.get(AlbumRecord, data["album"], AlbumRecord.from_dict),
+        )
+
+    def dict(self) -> dict:
+        return {
+            "id": self.id,
+            "uri": self.uri,
+            "name": self.name,
+            "external_urls": {"spotify": self.url},
+            "artists": [a.dict() for a in self.artists],
+            "album": self.album.dict(),
+        }
+
+
+class ListTrackRecord(Record):
+    __slots__ = ("added_at", "track")
+
+    def __init__(self, added_at: datetime, track: TrackRecord) -> None:
+        self.added_at = added_at
+        self.track = track
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ListTrackRecord":
+        return cls(
+            _datetime(data["added_at"]),
+            models.identity.get(TrackRecord, data["track"], TrackRecord.from_dict),
+        )
+
+    def dict(self) -> dict:
+        return {"added_at": self.added_at.isoformat(), "track": self.track.dict()}
+
+
+RECORDS = {
+    models.Image: ImageRecord,
+    models.User: UserRecord,
+    models.Artist: ArtistRecord,
+    models.Album: AlbumRecord,
+    models.Playlist: PlaylistRecord,
+    models.Track: TrackRecord,
+    models.ListTrack: ListTrackRecord,
+}
+
+
+def build(model, data: dict, lean: bool = False):
+    if lean:
+        return RECORDS[model].from_dict(data)
+
+    return models.build_shared(model, data)
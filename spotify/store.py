@@ -0,0 +1,264 @@
+import os
+import json
+import sqlite3
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Tuple, TYPE_CHECKING
+
+from .models import ListTrack, Playlist
+from .projection import Projection
+from .records import build
+
+if TYPE_CHECKING:
+    from .endpoints.library import LibraryEndpoint
+    from .endpoints.playlists import PlaylistsEndpoint
+
+
+class Store:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    # bump whenever SCHEMA changes in a way CREATE IF NOT EXISTS won't pick
+    # up. whatever is in a store can be fetched again, so an older one is
+    # dropped and started over instead of migrated
+    VERSION = 1
+
+    # what goes when it is, tables and meta keys
+    TABLES: Tuple[str, ...] = ()
+    META: Tuple[str, ...] = ()
+
+    def __init__(self, path: str, lean: bool = False) -> None:
+        self._lean = lean
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._db = sqlite3.connect(path)
+        self._db.executescript(Store.SCHEMA)
+
+        self._migrate()
+
+    def _migrate(self):
+        # several stores can share a file, so each keeps a version of its own.
+        # ones from before there were versions count as the first
+        key = f"version.{type(self).__name__}"
+
+        if (self._get_meta(key) or "1") != str(self.VERSION):
+            with self._db:
+                for table in self.TABLES:
+                    self._db.execute(f"DROP TABLE IF EXISTS {table}")
+
+                self._db.executemany(
+                    "DELETE FROM meta WHERE key = ?", [(k,) for k in self.META]
+                )
+
+        self._db.executescript(self.SCHEMA)
+
+        with self._db:
+            self._set_meta(key, str(self.VERSION))
+
+    def _get_meta(self, key: str) -> str:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def close(self):
+        self._db.close()
+
+
+class LibraryStore(Store):
+    # seq is where a track sits in what spotify hands back, so tracks saved
+    # in the same second keep the order they came in
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS saved_tracks (
+        id TEXT PRIMARY KEY,
+        added_at TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS saved_tracks_order ON saved_tracks (added_at, seq);
+    """
+
+    VERSION = 2
+    TABLES = ("saved_tracks",)
+    META = ("reconciled_at",)
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM saved_tracks").fetchone()[0]
+
+    def iter(self, projection: Projection = None) -> Iterator[ListTrack]:
+        # straight off the cursor, oldest first, without holding on to any of it
+        for (data,) in self._db.execute(
+            "SELECT data FROM saved_tracks ORDER BY added_at, seq"
+        ):
+            if projection:
+                yield projection.model(**json.loads(data))
+            else:
+                yield build(ListTrack, json.loads(data), self._lean)
+
+    def load(self) -> List[ListTrack]:
+        return list(self.iter())
+
+    def newest(self, count: int) -> List[str]:
+        # ids of the last `count` saved, in the order spotify lists them
+        return [
+            id
+            for (id,) in self._db.execute(
+                "SELECT id FROM saved_tracks ORDER BY added_at DESC, seq LIMIT ?",
+                (count,),
+            )
+        ]
+
+    def _save(self, tracks: List[ListTrack], seq: int = 0):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO saved_tracks (id, added_at, seq, data) VALUES (?, ?, ?, ?)",
+            [
+                (t.track.id, t.added_at.isoformat(), seq + i, t.json())
+                for i, t in enumerate(tracks)
+            ],
+        )
+
+    def _needs_reconcile(self, every: timedelta) -> bool:
+        last = self._get_meta("reconciled_at")
+
+        if last is None:
+            return True
+
+        return datetime.fromisoformat(last) < datetime.now(timezone.utc) - every
+
+    async def reconcile(self, library: "LibraryEndpoint", **kwargs):
+        tracks = [t async for t in library.get_tracks(**kwargs)]
+
+        with self._db:
+            self._db.execute("DELETE FROM saved_tracks")
+            self._save(tracks)
+            self._set_meta("reconciled_at", datetime.now(timezone.utc).isoformat())
+
+    async def update(self, library: "LibraryEndpoint") -> int:
+        # saved tracks come back newest first, so we can stop as soon as we
+        # hit one that we already have
+        known = dict(self._db.execute("SELECT id, added_at FROM saved_tracks"))
+
+        new = []
+
+        async for track in library.get_tracks():
+            if known.get(track.track.id) == track.added_at.isoformat():
+                break
+
+            new.append(track)
+
+        # new ones come before everything we have
+        (first,) = self._db.execute("SELECT MIN(seq) FROM saved_tracks").fetchone()
+
+        with self._db:
+            self._save(new, (first or 0) - len(new))
+
+        return len(new)
+
+    async def sync(
+        self,
+        library: "LibraryEndpoint",
+        reconcile_every: timedelta = timedelta(days=7),
+        **kwargs,
+    ):
+        if self._needs_reconcile(reconcile_every):
+            await self.reconcile(library, **kwargs)
+
+        else:
+            await self.update(library)
+
+            # anything removed since the last run leaves us with more tracks
+            # than spotify has, so do a full pass to find out which. as many
+            # removed as added evens the count out, but if any of them were
+            # recent the newest page gives it away
+            total, newest = await library.head()
+
+            if len(self) != total or self.newest(len(newest)) != newest:
+                await self.reconcile(library, **kwargs)
+
+
+def _fields(projection: Projection) -> str:
+    return projection.fields() if projection else ""
+
+
+class PlaylistStore(Store):
+    # one entry per projection, so the mirror's uris and the full export of
+    # the same playlist don't push each other out
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS playlist_tracks (
+        id TEXT NOT NULL,
+        fields TEXT NOT NULL,
+        snapshot_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (id, fields)
+    );
+    """
+
+    VERSION = 2
+    TABLES = ("playlist_tracks",)
+
+    def _load(self, playlist: Playlist, projection: Projection) -> List[ListTrack]:
+        row = self._db.execute(
+            "SELECT data FROM playlist_tracks WHERE id = ? AND snapshot_id = ? AND fields = ?",
+            (playlist.id, playlist.snapshot_id, _fields(projection)),
+        ).fetchone()
+
+        if not row:
+            return None
+
+        if projection:
+            return [projection.model(**t) for t in json.loads(row[0])]
+
+        return [build(ListTrack, t, self._lean) for t in json.loads(row[0])]
+
+    def _save(self, playlist: Playlist, projection: Projection, tracks: List[ListTrack]):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO playlist_tracks (id, snapshot_id, fields, data) VALUES (?, ?, ?, ?)",
+                (
+                    playlist.id,
+                    playlist.snapshot_id,
+                    _fields(projection),
+                    f"[{','.join(t.json() for t in tracks)}]",
+                ),
+            )
+
+    async def get_tracks(
+        self,
+        playlists: "PlaylistsEndpoint",
+        playlist: Playlist,
+        projection: Projection = None,
+        **kwargs,
+    ) -> List[ListTrack]:
+        # the snapshot id changes whenever the playlist does, so a hit means
+        # the tracks we have are still current
+        tracks = self._load(playlist, projection)
+
+        if tracks is None:
+            tracks = [
+                t
+                async for t in playlists.get_tracks(
+                    playlist.id, projection=projection, **kwargs
+                )
+            ]
+            self._save(playlist, projection, tracks)
+
+        return tracks
+
+    def evict(self, playlist_ids: Iterable[str]):
+        stale = {
+            id for (id,) in self._db.execute("SELECT id FROM playlist_tracks")
+        }.difference(playlist_ids)
+
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM playlist_tracks WHERE id = ?", [(id,) for id in stale]
+            )
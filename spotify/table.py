@@ -0,0 +1,94 @@
+import sys
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from .models import ListTrack
+
+
+class TrackTable:
+    """
+    A list of tracks stored as columns: arrays for timestamps and for the
+    album and artists of each track, and interned strings for the rest.
+    Every album and every distinct set of artists is stored once and
+    referred to by number.
+
+    Sorting only touches the columns it needs and hands back row numbers,
+    which csv_rows() takes, so nothing gets copied on the way to the CSV.
+    """
+
+    def __init__(self) -> None:
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.urls: List[str] = []
+
+        # epoch seconds
+        self.added_at = array("q")
+
+        self.albums = array("l")
+        self.artists = array("l")
+
+        # what the codes in albums and artists stand for
+        self.album_names: List[str] = []
+        self.artist_names: List[str] = []
+
+        self._album_codes: Dict[str, int] = {}
+        self._artist_codes: Dict[Tuple[str, ...], int] = {}
+
+    @classmethod
+    def from_tracks(cls, tracks: Iterable[ListTrack]) -> "TrackTable":
+        table = cls()
+
+        for track in tracks:
+            table.append(track)
+
+        return table
+
+    def append(self, track: ListTrack):
+        t = track.track
+
+        self.ids.append(t.id)
+        self.names.append(sys.intern(t.name))
+        self.urls.append(t.url)
+        self.added_at.append(int(track.added_at.timestamp()))
+
+        code = self._album_codes.get(t.album.id)
+        if code is None:
+            code = self._album_codes[t.album.id] = len(self.album_names)
+            self.album_names.append(sys.intern(t.album.name))
+
+        self.albums.append(code)
+
+        key = tuple(a.id for a in t.artists)
+
+        code = self._artist_codes.get(key)
+        if code is None:
+            code = self._artist_codes[key] = len(self.artist_names)
+            self.artist_names.append(
+                sys.intern(", ".join(artist.name for artist in t.artists))
+            )
+
+        self.artists.append(code)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def order(self) -> List[int]:
+        # oldest first, ties broken by name so the order is stable between runs
+        rows = sorted(range(len(self)), key=self.names.__getitem__)
+        rows.sort(key=self.added_at.__getitem__)
+        return rows
+
+    def csv_rows(self, rows: Sequence[int] = None) -> Iterator[List[str]]:
+        # title, album, artist, id, url
+        albums = self.album_names
+        artists = self.artist_names
+
+        for row in range(len(self)) if rows is None else rows:
+            yield [
+                self.names[row],
+                albums[self.albums[row]],
+                artists[self.artists[row]],
+                self.ids[row],
+                self.urls[row],
+            ]
@@ -1,2 +1,4 @@
 from .paginator import Paginator
-from .chunker import Chunker
+from .batcher import Batcher
+from .profiler import Profiler, LoopWatchdog
+from .pipeline import Pipeline
@@ -0,0 +1,148 @@
+import asyncio
+
+from collections import deque
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Union
+
+
+_END = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class Batcher:
+    """
+    Groups whatever comes out of an iterable, sync or async, into batches of
+    up to `size`.
+
+    An async source is read ahead into a buffer of `buffer` items (`size` by
+    default) while the last batch is still being sent, and waits for room
+    once that is full. With a `timeout`, a batch is sent off once its first
+    item has waited that long, full or not, so a slow producer doesn't hold
+    up what it already made.
+    """
+
+    def __init__(
+        self,
+        source: Union[Iterable, AsyncIterable],
+        size: int,
+        timeout: float = None,
+        buffer: int = None,
+    ) -> None:
+        self.size = size
+        self.timeout = timeout
+
+        self._source = source
+        self._iter = None if hasattr(source, "__aiter__") else iter(source)
+
+        self._queue: asyncio.Queue = None
+        self._buffer = buffer or size
+        self._task: asyncio.Task = None
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def _produce(self):
+        try:
+            async for item in self._source:
+                await self._queue.put(item)
+
+        except Exception as e:
+            await self._queue.put(_Failed(e))
+            return
+
+        await self._queue.put(_END)
+
+    async def _get(self, deadline: float):
+        if deadline is None:
+            return await self._queue.get()
+
+        remaining = deadline - asyncio.get_running_loop().time()
+
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+
+        return await asyncio.wait_for(self._queue.get(), remaining)
+
+    async def __anext__(self) -> List:
+        if self._done:
+            raise StopAsyncIteration
+
+        if self._iter is not None:
+            batch = list(islice(self._iter, self.size))
+
+            if not batch:
+                self._done = True
+                raise StopAsyncIteration
+
+            return batch
+
+        if self._task is None:
+            self._queue = asyncio.Queue(self._buffer)
+            self._task = asyncio.ensure_future(self._produce())
+
+        batch = []
+        deadline = None
+
+        while len(batch) < self.size:
+            try:
+                item = await self._get(deadline)
+            except asyncio.TimeoutError:
+                break
+
+            if item is _END:
+                self._done = True
+                break
+
+            if isinstance(item, _Failed):
+                self._done = True
+                raise item.error
+
+            batch.append(item)
+
+            # the clock starts with the first item in the batch
+            if deadline is None and self.timeout is not None:
+                deadline = asyncio.get_running_loop().time() + self.timeout
+
+        if not batch:
+            raise StopAsyncIteration
+
+        return batch
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def map(
+        self, func: Callable[[List], Awaitable], concurrency: int = 1
+    ) -> AsyncIterator:
+        """
+        func over every batch with up to `concurrency` calls in flight,
+        results come back in the order of the batches. Leave concurrency at 1
+        where the calls have to land in order.
+        """
+        pending: deque = deque()
+
+        try:
+            async for batch in self:
+                pending.append(asyncio.ensure_future(func(batch)))
+
+                if len(pending) >= concurrency:
+                    yield await pending.popleft()
+
+            while pending:
+                yield await pending.popleft()
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+            self.close()
+
+    async def run(self, func: Callable[[List], Awaitable], concurrency: int = 1):
+        async for _ in self.map(func, concurrency):
+            pass
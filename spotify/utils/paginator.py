@@ -1,13 +1,26 @@
+import asyncio
+
+from collections import deque
+
+
 class Paginator:
     API_LIMIT = 50  # fingers crossed this is constant....
 
-    def __init__(self, func, *args, **kwargs) -> None:
+    def __init__(self, func, *args, concurrency: int = None, **kwargs) -> None:
         self._func = func
 
         self.limit: int = kwargs.get("limit", None)
 
+        # how many pages may be in flight at once, None fetches them one
+        # by one as they are consumed
+        self.concurrency: int = concurrency
+
         self.count: int = 0
-        self.data: list = []
+        self.total: int = None
+        self.data: deque = deque()
+
+        self._offset: int = 0
+        self._pending: deque = deque()
 
         self._args = args
         self._kwargs = kwargs
@@ -15,35 +28,85 @@ class Paginator:
     def __aiter__(self):
         return self
 
-    async def _make_req(self):
-        kwargs = self._kwargs
+    def _end(self):
+        end = self.total
 
-        if not self.limit is None:
-            remaining = self.limit - self.count
+        if self.limit is not None:
+            end = self.limit if end is None else min(end, self.limit)
 
-        if self.limit is None or remaining > self.API_LIMIT:
-            limit = 50
+        return end
+
+    def _page_size(self):
+        end = self._end()
+
+        if end is None:
+            return self.API_LIMIT
+
+        return min(self.API_LIMIT, end - self._offset)
+
+    def _schedule(self):
+        # until the first page tells us the total we can only go one at a time
+        if self.total is None or not self.concurrency:
+            window = 1
         else:
-            limit = remaining
+            window = self.concurrency
+
+        while len(self._pending) < window:
+            limit = self._page_size()
 
-        kwargs["limit"] = limit
-        kwargs["offset"] = self.count
+            if limit <= 0:
+                break
+
+            self._pending.append(
+                asyncio.ensure_future(self._make_req(self._offset, limit))
+            )
+            self._offset += limit
+
+    async def _make_req(self, offset: int, limit: int):
+        kwargs = {**self._kwargs, "limit": limit, "offset": offset}
 
         req = await self._func(*self._args, **kwargs)
 
-        self.data = req.pop("items")
+        items = req.pop("items")
+
+        if self.total is None:
+            if req.get("total") is not None:
+                self.total = req["total"]
+
+            # no total in the response (ie. a fields filter), so fall back to
+            # stopping on the last page instead of requesting an empty one
+            elif req.get("next", "") is None or len(items) < limit:
+                self.total = offset + len(items)
+
+        return items
+
+    async def _fill(self):
+        self._schedule()
+
+        while not self.data and self._pending:
+            try:
+                self.data.extend(await self._pending.popleft())
+            except BaseException:
+                for task in self._pending:
+                    task.cancel()
+
+                self._pending.clear()
+                raise
+
+            # keep the window full while the caller works through this page
+            if self.concurrency or not self.data:
+                self._schedule()
 
     async def __anext__(self):
         if self.limit is not None and self.count == self.limit:
             raise StopAsyncIteration
 
         if not self.data:
-            await self._make_req()
+            await self._fill()
 
-        # wastes an extra request but I am lazy
         if not self.data:
             raise StopAsyncIteration
 
         self.count += 1
 
-        return self.data.pop(0)
+        return self.data.popleft()
@@ -0,0 +1,92 @@
+import asyncio
+
+from contextlib import nullcontext
+from typing import Awaitable, Callable, ContextManager, Dict, Iterable, List, Tuple
+
+
+class Pipeline:
+    """
+    The stages of a run and which other stages each of them needs done
+    first. run() starts every stage as soon as what it needs is through, so
+    stages that don't depend on each other run side by side.
+
+    A stage that fails only takes the stages that need it down with it,
+    those are skipped and everything else still runs. Stages can only need
+    ones added before them, so there's no way to make a cycle.
+    """
+
+    def __init__(
+        self,
+        wrap: Callable[[str], ContextManager] = None,
+        on_error: Callable[[str, BaseException], None] = None,
+    ) -> None:
+        # entered around every stage, for timing and such
+        self.wrap = wrap or (lambda name: nullcontext())
+        self.on_error = on_error
+
+        self.stages: Dict[str, Tuple[Callable[[], Awaitable], Tuple[str, ...]]] = {}
+
+        self.failed: Dict[str, BaseException] = {}
+        self.skipped: List[str] = []
+
+    def add(self, name: str, func: Callable[[], Awaitable], after: Iterable[str] = ()):
+        after = tuple(after)
+
+        for need in after:
+            if need not in self.stages:
+                raise ValueError(f"{name} needs {need}, which hasn't been added")
+
+        self.stages[name] = (func, after)
+
+    async def run(self) -> bool:
+        tasks: Dict[str, asyncio.Task] = {}
+
+        for name, (func, after) in self.stages.items():
+            tasks[name] = asyncio.ensure_future(
+                self._run(name, func, [tasks[need] for need in after])
+            )
+
+        await asyncio.gather(*tasks.values())
+
+        return not self.failed and not self.skipped
+
+    async def _run(self, name: str, func, after: List[asyncio.Task]) -> bool:
+        # stages keep their errors to themselves, so this only ever waits
+        if not all(await asyncio.gather(*after)):
+            self.skipped.append(name)
+            return False
+
+        try:
+            with self.wrap(name):
+                await func()
+
+        except Exception as e:
+            self.failed[name] = e
+
+            if self.on_error:
+                self.on_error(name, e)
+
+            return False
+
+        return True
+
+    def critical_path(self, times: Dict[str, List[float]]) -> List[str]:
+        """
+        The chain of stages that the run actually waited on, from the stage
+        that finished last back through whichever of its needs finished last.
+        `times` is start and end for each stage that ran, like Metrics.stages.
+        """
+        path = []
+        name = max(times, key=lambda name: times[name][1], default=None)
+
+        while name is not None:
+            path.append(name)
+
+            _, after = self.stages[name]
+            name = max(
+                (need for need in after if need in times),
+                key=lambda need: times[need][1],
+                default=None,
+            )
+
+        return path[::-1]
@@ -0,0 +1,204 @@
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+
+def _describe(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "no task (a callback or the loop itself)"
+
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+
+class LoopWatchdog:
+    """
+    Watches the event loop from a thread of its own. A task on the loop
+    checks in every `interval`; once it's more than `threshold` late the loop
+    is stuck on something, and the thread takes note of which task was
+    running and where, so whoever held it up can be named when it lets go.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.02,
+        on_block: Callable[[str], None] = None,
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.on_block = on_block
+
+        self.blocks: List[dict] = []
+        self.max_lag = 0.0
+
+        self._loop: asyncio.AbstractEventLoop = None
+        self._loop_thread: int = None
+        self._task: asyncio.Task = None
+        self._thread: threading.Thread = None
+        self._stopped = threading.Event()
+
+        self._lock = threading.Lock()
+        self._beat = 0.0
+        self._culprit: dict = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+        self._task = asyncio.ensure_future(self._tick())
+
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._stopped.set()
+        self._task.cancel()
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._thread.join()
+
+    async def _tick(self):
+        self._beat = time.monotonic()
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            # check in before anything else, or the thread takes us for
+            # whatever held the loop up
+            with self._lock:
+                now = time.monotonic()
+                lag = now - self._beat - self.interval
+
+                self._beat = now
+                culprit, self._culprit = self._culprit, None
+
+            self.max_lag = max(self.max_lag, lag)
+
+            if lag < self.threshold:
+                continue
+
+            # too short for the thread to get a look in
+            culprit = culprit or {"task": "unknown", "stack": []}
+
+            block = {"seconds": round(lag, 6), **culprit}
+            self.blocks.append(block)
+
+            if self.on_block:
+                where = culprit["stack"][-1] if culprit["stack"] else "?"
+                self.on_block(
+                    f"Event loop blocked for {lag * 1000:.0f}ms by {culprit['task']} at {where}"
+                )
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                stale = time.monotonic() - self._beat - self.interval
+
+                # only the first look while it's stuck, that's the closest
+                # we get to what started it
+                if stale < self.threshold or self._culprit is not None:
+                    continue
+
+                frame = sys._current_frames().get(self._loop_thread)
+
+                self._culprit = {
+                    "task": _describe(asyncio.current_task(self._loop)),
+                    "stack": [
+                        f"{f.filename}:{f.lineno} in {f.name}"
+                        for f in traceback.extract_stack(frame)[-8:]
+                    ]
+                    if frame
+                    else [],
+                }
+
+    def report(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "max_lag": round(self.max_lag, 6),
+            "blocked": len(self.blocks),
+            "blocked_seconds": round(sum(b["seconds"] for b in self.blocks), 6),
+        }
+
+
+class Profiler:
+    """
+    cProfile for each stage of a run, plus a LoopWatchdog over all of it.
+    Every stage leaves a .prof for snakeviz and friends and a .txt of the
+    top of it by cumulative time in `directory`, next to a loop.json of
+    every time the loop got stuck.
+
+    Only one profile can be running at a time, so a stage that starts while
+    another is being profiled ends up in that one's profile. Where stages
+    run side by side, profile the whole run as one stage instead.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        lag_threshold: float = 0.1,
+        on_block: Callable[[str], None] = None,
+    ) -> None:
+        self.directory = directory
+        self.watchdog = LoopWatchdog(lag_threshold, on_block=on_block)
+
+        self._active: str = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.watchdog.start()
+
+    async def stop(self):
+        await self.watchdog.stop()
+
+        with open(os.path.join(self.directory, "loop.json"), "w") as f:
+            json.dump({**self.watchdog.report(), "blocks": self.watchdog.blocks}, f, indent=2)
+
+    @contextmanager
+    def stage(self, name: str):
+        if self._active is not None:
+            yield
+            return
+
+        self._active = name
+        profile = cProfile.Profile()
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active = None
+
+            self._dump(name, profile)
+
+    def _dump(self, name: str, profile: cProfile.Profile):
+        path = os.path.join(self.directory, name)
+
+        profile.dump_stats(f"{path}.prof")
+
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(40)
+
+        with open(f"{path}.txt", "w") as f:
+            f.write(out.getvalue())
+
+    def report(self) -> dict:
+        return {"directory": self.directory, **self.watchdog.report()}
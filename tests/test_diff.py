@@ -0,0 +1,139 @@
+import asyncio
+import random
+
+import pytest
+
+from spotify.diff import BATCH_SIZE, PlaylistDiff
+
+
+class FakePlaylist:
+    """A playlist that does what spotify does with each call, and counts them"""
+
+    def __init__(self, uris: list) -> None:
+        self.uris = list(uris)
+        self.calls = 0
+
+    def _batches(self, uris: list) -> int:
+        return -(-len(uris) // BATCH_SIZE)
+
+    async def remove_tracks(self, playlist_id, uris):
+        # every copy of each uri goes
+        self.calls += self._batches(uris)
+
+        gone = set(uris)
+        self.uris = [uri for uri in self.uris if uri not in gone]
+
+    async def reorder_tracks(self, playlist_id, range_start, insert_before, range_length=1):
+        self.calls += 1
+
+        block = self.uris[range_start : range_start + range_length]
+        del self.uris[range_start : range_start + range_length]
+
+        # insert_before counts from before the block was taken out
+        at = insert_before if insert_before < range_start else insert_before - range_length
+        self.uris[at:at] = block
+
+    async def add_tracks(self, playlist_id, uris, position=None):
+        self.calls += self._batches(uris)
+
+        if position is None:
+            self.uris.extend(uris)
+        else:
+            self.uris[position:position] = uris
+
+    async def replace_tracks(self, playlist_id, uris):
+        self.calls += max(1, self._batches(uris))
+        self.uris = list(uris)
+
+
+def check(desired: list, current: list) -> PlaylistDiff:
+    diff = PlaylistDiff(desired, current)
+    playlist = FakePlaylist(current)
+
+    asyncio.run(diff.apply(playlist, "playlist"))
+
+    assert playlist.uris == list(dict.fromkeys(desired))
+    assert playlist.calls == diff.calls
+
+    return diff
+
+
+def uris(*ids) -> list:
+    return [f"spotify:track:{i}" for i in ids]
+
+
+def test_up_to_date():
+    diff = check(uris(1, 2, 3), uris(1, 2, 3))
+
+    assert not diff
+
+
+def test_small_playlists_are_rewritten():
+    # one call either way, so no point patching
+    diff = check(uris(0, 1, 3, 2, 5), uris(1, 2, 3, 4))
+
+    assert diff.replace is not None
+
+
+def test_insert_remove_and_move():
+    current = list(range(500))
+    desired = [1000, *current[:100], 250, *current[100:250], *current[251:400], 1001]
+
+    diff = check(uris(*desired), uris(*current))
+
+    assert diff.replace is None
+    assert diff.remove == uris(*range(400, 500))
+    assert len(diff.moves) == 1
+
+
+def test_duplicates_come_back_once():
+    current = [*range(500), 7, 300]
+    diff = check(uris(*range(500)), uris(*current))
+
+    assert diff.replace is None
+    assert set(diff.remove) == set(uris(7, 300))
+
+
+def test_empty():
+    check([], uris(1, 2))
+    check(uris(1, 2), [])
+
+
+def test_reversed_is_rewritten():
+    diff = check(uris(*range(300)), uris(*reversed(range(300))))
+
+    assert diff.replace is not None
+
+
+def test_new_saves_are_two_calls():
+    # the mirror after a few saves: new tracks at the end, nothing else
+    diff = check(uris(*range(1000)), uris(*range(990)))
+
+    assert diff.calls == 1
+
+
+# small ones mostly get rewritten, big ones patched
+@pytest.mark.parametrize("size", [60, 400])
+def test_random(size):
+    rand = random.Random(size)
+
+    for _ in range(200):
+        pool = rand.randint(0, size)
+        current = [rand.randrange(pool) for _ in range(rand.randint(0, size))] if pool else []
+        desired = rand.sample(range(pool + 10), rand.randint(0, pool + 10))
+
+        # mostly small edits of the same playlist, like the mirror sees
+        if current and rand.random() < 0.7:
+            desired = list(dict.fromkeys(current))
+
+            for _ in range(rand.randint(0, 5)):
+                op = rand.random()
+
+                if op < 0.3 and desired:
+                    desired.pop(rand.randrange(len(desired)))
+                elif op < 0.6:
+                    desired.insert(rand.randint(0, len(desired)), 10_000 + rand.randrange(1000))
+                elif desired:
+                    desired.insert(rand.randint(0, len(desired) - 1), desired.pop())
+
+        check(uris(*desired), uris(*current))
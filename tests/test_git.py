@@ -0,0 +1,110 @@
+import asyncio
+import subprocess
+
+import pytest
+
+pytest.importorskip("derw")
+
+import update  # noqa: E402
+
+from benchmarks.update_run import make_repo  # noqa: E402
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    for name in ("GIT_COMMITTER_NAME", "GIT_AUTHOR_NAME"):
+        monkeypatch.setenv(name, "test")
+    for name in ("GIT_COMMITTER_EMAIL", "GIT_AUTHOR_EMAIL"):
+        monkeypatch.setenv(name, "test@localhost")
+
+    repo = make_repo(str(tmp_path))
+
+    monkeypatch.setattr(update, "GIT_REPO", repo)
+    monkeypatch.setattr(update, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(update, "GIT_COMMITTER_NAME", "test")
+    monkeypatch.setattr(update, "GIT_COMMITTER_EMAIL", "test@localhost")
+    monkeypatch.setattr(update, "GIT_PASSWORD", None)
+
+    (tmp_path / "cache").mkdir()
+
+    return repo
+
+
+def origin(repo: str, *args) -> str:
+    return subprocess.run(
+        ["git", "--git-dir", f"{repo}/../origin.git", *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def export(git: update.Git, files: dict, remove: str = None, commit: bool = True):
+    async def run():
+        try:
+            await git.pull()
+
+            out = git.output()
+
+            for path, content in files.items():
+                await out.write(path, content)
+
+            if remove is not None:
+                out.remove_stale(remove, "*.csv")
+
+            out.save()
+
+            if commit:
+                await git.commit_and_push(out.changed, out.written)
+        finally:
+            await git.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("git_class", [update.Git, update.GitImport])
+def test_export_reaches_origin(repo, git_class):
+    export(git_class(), {"a.csv": "a\n", "playlists/b.csv": "b\n"})
+
+    assert origin(repo, "show", "master:a.csv") == "a\n"
+    assert origin(repo, "show", "master:playlists/b.csv") == "b\n"
+
+    # stale files go, unchanged ones don't make a commit of their own
+    export(git_class(), {"a.csv": "a\n"}, remove="playlists")
+
+    assert origin(repo, "ls-tree", "-r", "--name-only", "master").split() == ["a.csv"]
+    assert origin(repo, "rev-list", "--count", "master").strip() == "3"
+
+    export(git_class(), {"a.csv": "a\n"})
+
+    assert origin(repo, "rev-list", "--count", "master").strip() == "3"
+
+
+@pytest.mark.parametrize("git_class", [update.Git, update.GitImport])
+def test_export_left_uncommitted_is_picked_up(repo, git_class):
+    export(git_class(), {"a.csv": "a\n"})
+
+    # died between writing and committing
+    export(git_class(), {"a.csv": "a\n", "playlists/new.csv": "new\n"}, commit=False)
+
+    assert origin(repo, "ls-tree", "-r", "--name-only", "master").split() == ["a.csv"]
+
+    export(git_class(), {"a.csv": "a\n", "playlists/new.csv": "new\n"})
+
+    assert origin(repo, "show", "master:playlists/new.csv") == "new\n"
+
+
+def test_close_stops_fast_import(repo):
+    git = update.GitImport()
+
+    async def run():
+        await git.pull()
+        await git.output().write("a.csv", "a\n")
+
+        # main died before the commit
+        await git.close()
+
+    asyncio.run(run())
+
+    assert git._proc.returncode is not None
+    assert origin(repo, "rev-list", "--count", "master").strip() == "1"
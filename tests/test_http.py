@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from async_spotify.spotify_errors import RateLimitExceeded
+
+from spotify import http
+from spotify.governor import Governor
+from spotify.http import RequestHandler
+
+
+class FakeApi:
+    def __init__(self) -> None:
+        self._api_request_handler = self
+
+
+class Flaky(RequestHandler):
+    """Fails with each of `errors` in turn, then succeeds"""
+
+    def __init__(self, *errors) -> None:
+        super().__init__(FakeApi(), governor=Governor())
+
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def _make_request(self, *args):
+        self.calls += 1
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return {"ok": True}
+
+
+def request(handler: RequestHandler, method: str, body: dict = None):
+    return asyncio.run(
+        handler.make_request(method, f"{http.API_URL}/playlists/x/tracks", {}, None, body=body)
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    monkeypatch.setattr(http, "RATE_LIMIT_WAIT", 0.01)
+
+
+def test_get_is_retried():
+    handler = Flaky(asyncio.TimeoutError())
+
+    assert request(handler, "GET") == {"ok": True}
+    assert handler.calls == 2
+
+
+@pytest.mark.parametrize(
+    "method, body",
+    [("POST", {"uris": ["a"]}), ("PUT", {"range_start": 0, "insert_before": 2})],
+)
+def test_unsafe_requests_are_not_retried(method, body):
+    handler = Flaky(asyncio.TimeoutError())
+
+    with pytest.raises(asyncio.TimeoutError):
+        request(handler, method, body)
+
+    assert handler.calls == 1
+
+
+def test_post_is_retried_on_429():
+    handler = Flaky(RateLimitExceeded({}, 0.01))
+
+    assert request(handler, "POST", {"uris": ["a"]}) == {"ok": True}
+    assert handler.calls == 2
+
+
+def test_429_without_retry_after_backs_off():
+    handler = Flaky(RateLimitExceeded({}, 0), RateLimitExceeded({}, 0))
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+
+        await handler.make_request("GET", http.API_URL, {}, None)
+
+        return asyncio.get_running_loop().time() - start
+
+    # 0.01, then 0.02
+    assert asyncio.run(run()) >= 0.03
+    assert handler.calls == 3
@@ -0,0 +1,44 @@
+from benchmarks import fixtures
+from spotify import models
+from spotify.models import ListTrack
+from spotify.records import build
+
+
+class Built:
+    def __init__(self, data: dict) -> None:
+        self.data = data
+
+
+def test_same_payload_is_shared():
+    for lean in (False, True):
+        a = build(ListTrack, fixtures.list_track(0), lean)
+        b = build(ListTrack, fixtures.list_track(0), lean)
+
+        assert a.track is b.track
+        assert a.track.album is b.track.album
+
+
+def test_changed_payload_is_not_shared():
+    for lean in (False, True):
+        old = fixtures.list_track(0)
+        new = fixtures.list_track(0)
+        new["track"]["album"] = {**new["track"]["album"], "images": []}
+
+        a = build(ListTrack, old, lean)
+        b = build(ListTrack, new, lean)
+
+        assert a.track is not b.track
+        assert b.track.album.images == []
+        assert a.track.artists[0] is b.track.artists[0]
+
+
+def test_partial_payload_is_not_shared():
+    full = fixtures.list_track(0)["track"]
+
+    # only some of the fields, like a projection fetches
+    partial = {"id": full["id"], "uri": full["uri"]}
+
+    kept = models.identity.get(Built, full, Built)
+
+    assert models.identity.get(Built, partial, Built).data is partial
+    assert models.identity.get(Built, dict(full), Built) is kept
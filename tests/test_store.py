@@ -0,0 +1,168 @@
+import asyncio
+import sqlite3
+
+from datetime import timedelta
+
+from benchmarks import fixtures
+from spotify import LibraryStore, PlaylistStore, Projection
+from spotify.models import ListTrack, Playlist
+
+
+class FakeLibrary:
+    """Saved tracks as spotify lists them, newest first"""
+
+    def __init__(self, tracks: list) -> None:
+        self.tracks = tracks
+
+    async def get_tracks(self, **kwargs):
+        for t in self.tracks:
+            yield ListTrack(**t)
+
+    async def head(self, limit: int = 50):
+        return len(self.tracks), [t["track"]["id"] for t in self.tracks[:limit]]
+
+
+def saved(i: int, hour: int) -> dict:
+    return fixtures.list_track(i, fixtures.EPOCH + timedelta(hours=hour))
+
+
+def ids(tracks) -> list:
+    return [t.track.id for t in tracks]
+
+
+def oldest_first(tracks: list) -> list:
+    # what update.py did before the store: spotify's order, stable sorted
+    return [t["track"]["id"] for t in sorted(tracks, key=lambda t: t["added_at"])]
+
+
+def sync(store: LibraryStore, library: FakeLibrary):
+    asyncio.run(store.sync(library))
+
+
+def test_ties_keep_spotify_order(tmp_path):
+    # 3, 2 and 1 saved in the same second, listed in that order
+    library = FakeLibrary([saved(4, 2), saved(3, 1), saved(2, 1), saved(1, 1), saved(0, 0)])
+    store = LibraryStore(str(tmp_path / "library.db"))
+
+    sync(store, library)
+
+    assert ids(store.iter()) == oldest_first(library.tracks)
+
+
+def test_update_puts_new_tracks_in_front(tmp_path):
+    library = FakeLibrary([saved(2, 1), saved(1, 1), saved(0, 0)])
+    store = LibraryStore(str(tmp_path / "library.db"))
+
+    sync(store, library)
+
+    library.tracks[:0] = [saved(5, 2), saved(4, 2), saved(3, 1)]
+    sync(store, library)
+
+    assert ids(store.iter()) == oldest_first(library.tracks)
+    assert store.newest(3) == ids(ListTrack(**t) for t in library.tracks[:3])
+
+
+def test_swapped_tracks_are_caught(tmp_path):
+    library = FakeLibrary([saved(i, i) for i in reversed(range(5))])
+    store = LibraryStore(str(tmp_path / "library.db"))
+
+    sync(store, library)
+
+    # one of the recent ones swapped for another, same count. the newest is
+    # still the same, so the incremental update stops before it gets there
+    library.tracks = [saved(4, 4), saved(2, 2), saved(1, 1), saved(0, 0), saved(9, 3)]
+    library.tracks.sort(key=lambda t: t["added_at"], reverse=True)
+
+    sync(store, library)
+
+    assert ids(store.iter()) == oldest_first(library.tracks)
+
+
+def test_old_schema_starts_over(tmp_path):
+    path = str(tmp_path / "library.db")
+
+    db = sqlite3.connect(path)
+    db.executescript(
+        """
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE saved_tracks (id TEXT PRIMARY KEY, added_at TEXT NOT NULL, data TEXT NOT NULL);
+        INSERT INTO meta VALUES ('reconciled_at', '2999-01-01T00:00:00+00:00');
+        INSERT INTO saved_tracks VALUES ('old', '2015-01-01T00:00:00+00:00', '{}');
+        """
+    )
+    db.commit()
+    db.close()
+
+    store = LibraryStore(path)
+    library = FakeLibrary([saved(1, 1), saved(0, 0)])
+
+    assert len(store) == 0
+
+    # without the reconcile marker the first sync is a full pass
+    sync(store, library)
+
+    assert ids(store.iter()) == oldest_first(library.tracks)
+
+    # and opening it again leaves it be
+    store.close()
+    assert len(LibraryStore(path)) == 2
+
+
+class FakePlaylists:
+    def __init__(self, tracks: list) -> None:
+        self.tracks = tracks
+        self.fetches = 0
+
+    async def get_tracks(self, playlist_id, projection=None, **kwargs):
+        self.fetches += 1
+
+        for t in self.tracks:
+            yield projection.model(**t) if projection else ListTrack(**t)
+
+
+URIS = Projection(ListTrack, "track.uri")
+
+
+def get_tracks(store: PlaylistStore, playlists: FakePlaylists, playlist, projection=None):
+    return asyncio.run(store.get_tracks(playlists, playlist, projection=projection))
+
+
+def test_projections_are_cached_side_by_side(tmp_path):
+    playlist = Playlist(**fixtures.playlist(0))
+    playlists = FakePlaylists([fixtures.list_track(i) for i in range(3)])
+    store = PlaylistStore(str(tmp_path / "playlists.db"))
+
+    full = get_tracks(store, playlists, playlist)
+    uris = get_tracks(store, playlists, playlist, URIS)
+
+    assert get_tracks(store, playlists, playlist) == full
+    assert get_tracks(store, playlists, playlist, URIS) == uris
+    assert playlists.fetches == 2
+
+    # a new snapshot is a miss
+    playlist.snapshot_id += "1"
+    get_tracks(store, playlists, playlist, URIS)
+
+    assert playlists.fetches == 3
+
+
+def test_playlist_store_from_before_projections(tmp_path):
+    path = str(tmp_path / "playlists.db")
+
+    db = sqlite3.connect(path)
+    db.executescript(
+        """
+        CREATE TABLE playlist_tracks (id TEXT PRIMARY KEY, snapshot_id TEXT NOT NULL, data TEXT NOT NULL);
+        INSERT INTO playlist_tracks VALUES ('pl', 'snap', '[]');
+        """
+    )
+    db.commit()
+    db.close()
+
+    playlist = Playlist(**fixtures.playlist(0))
+    playlists = FakePlaylists([fixtures.list_track(0)])
+    store = PlaylistStore(path)
+
+    assert len(get_tracks(store, playlists, playlist, URIS)) == 1
+    assert len(get_tracks(store, playlists, playlist, URIS)) == 1
+    assert playlists.fetches == 1
@@ -0,0 +1,57 @@
+import random
+
+from datetime import timedelta
+
+import pytest
+
+from benchmarks import fixtures
+from spotify import ListTrack, TrackTable
+from spotify.records import build
+
+
+def row(track) -> list:
+    # what playlists were exported as before the table
+    return [
+        track.track.name,
+        track.track.album.name,
+        ", ".join(artist.name for artist in track.track.artists),
+        track.track.id,
+        track.track.url,
+    ]
+
+
+def playlist(size: int, lean: bool) -> list:
+    rand = random.Random(size)
+
+    # a handful of distinct times so plenty of tracks tie, and names that
+    # don't sort the same way as the order they're listed in
+    items = [
+        fixtures.list_track(
+            rand.randrange(10_000),
+            fixtures.EPOCH + timedelta(seconds=rand.randrange(5)),
+            n_artists=7,
+            n_albums=5,
+        )
+        for _ in range(size)
+    ]
+
+    return [build(ListTrack, item, lean) for item in items]
+
+
+@pytest.mark.parametrize("lean", [False, True])
+@pytest.mark.parametrize("size", [0, 1, 300])
+def test_csv_rows_in_export_order(lean, size):
+    tracks = playlist(size, lean)
+    table = TrackTable.from_tracks(tracks)
+
+    expected = [row(t) for t in sorted(tracks, key=lambda t: (t.added_at, t.track.name))]
+
+    assert list(table.csv_rows(table.order())) == expected
+
+
+def test_csv_rows_in_listed_order():
+    tracks = playlist(50, True)
+    table = TrackTable.from_tracks(tracks)
+
+    assert list(table.csv_rows()) == [row(t) for t in tracks]
+    assert list(table.csv_rows([3, 0])) == [row(tracks[3]), row(tracks[0])]
@@ -0,0 +1,231 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+pytest.importorskip("derw")
+
+import tracklists  # noqa: E402
+
+
+def acquire_times(bucket: tracklists.TokenBucket, callers: int, each: int) -> list:
+    times = []
+
+    async def caller():
+        for _ in range(each):
+            await bucket.acquire()
+            times.append(time.monotonic())
+
+    async def run():
+        await asyncio.gather(*[caller() for _ in range(callers)])
+
+    asyncio.run(run())
+
+    return sorted(times)
+
+
+@pytest.mark.parametrize("jitter", [0.0, 0.5])
+def test_token_bucket_spacing_across_callers(jitter):
+    random.seed(0)
+
+    rate = 100
+    bucket = tracklists.TokenBucket(rate, burst=1, jitter=jitter)
+    times = acquire_times(bucket, callers=5, each=8)
+
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    mean = (times[-1] - times[0]) / len(gaps)
+
+    # never closer than the rate, whoever is asking
+    assert min(gaps) >= 1 / rate * 0.9
+    assert max(gaps) <= (1 + jitter) / rate + 0.02
+
+    # and the jitter stays a share of the gap
+    assert mean == pytest.approx(1 / bucket.steady_rate, rel=0.25)
+
+
+def test_token_bucket_burst():
+    bucket = tracklists.TokenBucket(10, burst=3)
+    times = acquire_times(bucket, callers=3, each=2)
+
+    # three straight away, then one every 100ms
+    assert times[2] - times[0] < 0.02
+    assert times[3] - times[0] >= 0.09
+
+
+def test_crawl_state(tmp_path):
+    crawls = tracklists.CrawlState(str(tmp_path / "tracklists.db"))
+
+    crawls.checkpoint("dj", ["b", "a"])
+    crawls.checkpoint("dj", ["a", "c"])
+    crawls.checkpoint("other", ["x"])
+
+    assert crawls.processed("dj") == {"a", "b", "c"}
+    assert crawls.watermarks("dj") == []
+
+    crawls.finish("dj", ["c", "b", "a"])
+
+    assert crawls.processed("dj") == set()
+    assert crawls.processed("other") == {"x"}
+    assert crawls.watermarks("dj") == ["c", "b", "a"]
+
+    # new ones go in front, only the newest few are kept
+    crawls.finish("dj", ["f", "e", "d"])
+    assert crawls.watermarks("dj") == ["f", "e", "d", "c", "b"]
+
+    # a crawl that found nothing new keeps what it had
+    crawls.finish("dj", [])
+    assert crawls.watermarks("dj") == ["f", "e", "d", "c", "b"]
+
+
+class FakeResponse:
+    def __init__(self, data) -> None:
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def text(self):
+        return self.data
+
+    async def json(self):
+        return self.data
+
+
+class FakeSite:
+    """
+    A DJ's tracklists, newest first, paged like the overview. Pages are
+    handed over as they'd be parsed, so _parse just passes them on.
+    """
+
+    PAGE = 3
+
+    def __init__(self, sets: list) -> None:
+        self.sets = sets
+
+    def _page(self, pos: int) -> list:
+        return [(id, f"/tracklist/{id}") for id in self.sets[pos : pos + self.PAGE]]
+
+    def get(self, url, **kwargs):
+        return FakeResponse(("dj-id", self._page(0)))
+
+    def post(self, url, data):
+        if data["pos"] >= len(self.sets):
+            return FakeResponse({"end": True})
+
+        return FakeResponse({"data": self._page(data["pos"])})
+
+
+class FakeTracklists(tracklists.Tracklists):
+    def __init__(self, site: FakeSite) -> None:
+        self._http = site
+        self.fetched = []
+        self.fail_at = None
+
+    async def _parse(self, func, page):
+        return page
+
+    async def get_songs(self, url: str):
+        id = url.rsplit("/", 1)[1]
+
+        if id == self.fail_at:
+            raise RuntimeError("connection reset")
+
+        self.fetched.append(id)
+
+        # one track of its own, and one every set plays
+        return [f"track-{id}", "anthem"]
+
+
+class FakePlaylists:
+    def __init__(self) -> None:
+        self.uris = []
+
+    async def get_tracks(self, playlist_id, projection=None):
+        for uri in self.uris:
+            yield projection.model(track={"id": uri.rsplit(":", 1)[1]})
+
+    async def add_tracks(self, playlist_id, uris):
+        self.uris.extend(uris)
+
+
+class FakeSpotify:
+    def __init__(self) -> None:
+        self.playlists = FakePlaylists()
+
+
+def core(tmp_path, site: FakeSite, spotify: FakeSpotify) -> tracklists.Core:
+    # everything Core.scrape touches, without a profiler or real clients
+    app = tracklists.Core.__new__(tracklists.Core)
+    app.spotify = spotify
+    app.tracklists = FakeTracklists(site)
+    app.crawls = tracklists.CrawlState(str(tmp_path / "tracklists.db"))
+    return app
+
+
+DJ = tracklists.DJ("dj", "playlist")
+
+
+def tracks(spotify: FakeSpotify) -> set:
+    return {uri.rsplit(":", 1)[1] for uri in spotify.playlists.uris}
+
+
+def test_scrape_resumes_after_interruption(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracklists, "FLUSH_SIZE", 4)
+
+    site = FakeSite([f"t{i}" for i in reversed(range(10))])
+    spotify = FakeSpotify()
+
+    # dies on t4. t9 to t7 made it in (the anthem counts once), t6 and t5
+    # hadn't been flushed yet
+    app = core(tmp_path, site, spotify)
+    app.tracklists.fail_at = "t4"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(app.scrape(DJ))
+
+    assert tracks(spotify) == {"anthem", "track-t9", "track-t8", "track-t7"}
+    assert app.crawls.processed("dj") == {"t9", "t8", "t7"}
+    assert app.crawls.watermarks("dj") == []
+
+    # picks up where it left off
+    app = core(tmp_path, site, spotify)
+    asyncio.run(app.scrape(DJ))
+
+    assert app.tracklists.fetched == [f"t{i}" for i in reversed(range(7))]
+    assert tracks(spotify) == {"anthem", *(f"track-t{i}" for i in range(10))}
+    assert len(spotify.playlists.uris) == 11
+    assert app.crawls.processed("dj") == set()
+    assert app.crawls.watermarks("dj") == ["t9", "t8", "t7", "t6", "t5"]
+
+    # two new sets, and only those get looked at
+    site.sets[:0] = ["t11", "t10"]
+
+    app = core(tmp_path, site, spotify)
+    asyncio.run(app.scrape(DJ))
+
+    assert app.tracklists.fetched == ["t11", "t10"]
+    assert app.crawls.watermarks("dj") == ["t11", "t10", "t9", "t8", "t7"]
+
+    # the newest one taken down, the next one along still stops it
+    site.sets.remove("t11")
+    site.sets.insert(0, "t12")
+
+    app = core(tmp_path, site, spotify)
+    asyncio.run(app.scrape(DJ))
+
+    assert app.tracklists.fetched == ["t12"]
+
+
+def test_watermarks_all_gone(tmp_path, caplog):
+    site = FakeSite([f"t{i}" for i in reversed(range(5))])
+    app = core(tmp_path, site, FakeSpotify())
+
+    async def run():
+        return [id async for id, _ in app.tracklists.get_tracklists("dj", ["gone"])]
+
+    assert asyncio.run(run()) == [f"t{i}" for i in reversed(range(5))]
+    assert "went through all 5" in caplog.text
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("derw")
+
+import update  # noqa: E402
+
+from benchmarks import fixtures  # noqa: E402
+from spotify.models import ListTrack, Playlist  # noqa: E402
+
+
+def saved(i: int, hour: int) -> ListTrack:
+    return ListTrack(**fixtures.list_track(i, fixtures.EPOCH + timedelta(hours=hour)))
+
+
+def uri(i: int) -> str:
+    return fixtures.track(i)["uri"]
+
+
+def test_purge_plan_across_playlists():
+    plan = update.PurgePlan(fixtures.EPOCH + timedelta(hours=10))
+
+    a = Playlist(**fixtures.playlist(0))
+    b = Playlist(**fixtures.playlist(1))
+    fresh = Playlist(**fixtures.playlist(2))
+
+    # 1 is in both, and in a twice. 3 is in b before it was in a
+    plan.add(a, [saved(1, 5), saved(2, 2), saved(1, 6), saved(3, 8), saved(4, 11)])
+    plan.add(b, [saved(3, 1), saved(1, 7), saved(5, 12)])
+
+    # nothing old enough, so nothing to do
+    plan.add(fresh, [saved(6, 20)])
+
+    assert plan
+    assert plan.library_ids() == [fixtures.track(i)["id"] for i in (3, 2, 1)]
+    assert plan.removals == [(a, [uri(1), uri(2), uri(3)]), (b, [uri(3), uri(1)])]
+
+    # one save for all three, one removal for each playlist
+    assert plan.calls == 3
+
+
+def test_purge_plan_batches():
+    plan = update.PurgePlan(fixtures.EPOCH + timedelta(hours=1000))
+    playlist = Playlist(**fixtures.playlist(0))
+
+    plan.add(playlist, [saved(i, i) for i in range(120)])
+
+    # 50 saves a call, 100 removals a call
+    assert plan.calls == 3 + 2
+
+
+def test_purge_plan_empty():
+    plan = update.PurgePlan(fixtures.EPOCH)
+
+    plan.add(Playlist(**fixtures.playlist(0)), [saved(1, 5)])
+
+    assert not plan
+    assert plan.library_ids() == [] and plan.calls == 0
@@ -0,0 +1,285 @@
+import asyncio
+import time
+
+import pytest
+
+from spotify.governor import Governor
+from spotify.utils import Batcher, Paginator, Pipeline
+
+
+class FakePages:
+    """A paged endpoint over `items`, keeping track of what was asked for"""
+
+    def __init__(self, items: list, total: bool = True, delay: float = 0.0) -> None:
+        self.items = items
+        self.total = total
+        self.delay = delay
+
+        self.requests = []
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def __call__(self, limit: int, offset: int, **kwargs):
+        self.requests.append((offset, limit))
+
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+
+        await asyncio.sleep(self.delay)
+
+        self.in_flight -= 1
+
+        page = {"items": self.items[offset : offset + limit]}
+
+        if self.total:
+            page["total"] = len(self.items)
+
+        return page
+
+
+async def collect(paginator: Paginator) -> list:
+    return [item async for item in paginator]
+
+
+@pytest.mark.parametrize("concurrency", [None, 1, 3])
+def test_paginator_in_order(concurrency):
+    pages = FakePages(list(range(230)), delay=0.001)
+
+    assert asyncio.run(collect(Paginator(pages, concurrency=concurrency))) == pages.items
+
+    # the last page only asks for what's left
+    assert sorted(pages.requests) == [(0, 50), (50, 50), (100, 50), (150, 50), (200, 30)]
+    assert pages.most_in_flight <= (concurrency or 1)
+
+
+def test_paginator_limit():
+    pages = FakePages(list(range(230)))
+
+    assert asyncio.run(collect(Paginator(pages, limit=70, concurrency=3))) == pages.items[:70]
+    assert sorted(pages.requests) == [(0, 50), (50, 20)]
+
+
+def test_paginator_without_total():
+    # a fields filter leaves the total out, so the short page is the last one
+    pages = FakePages(list(range(100)), total=False)
+
+    assert asyncio.run(collect(Paginator(pages, concurrency=3))) == pages.items
+    assert pages.requests == [(0, 50), (50, 50), (100, 50)]
+
+
+def test_paginator_error_cancels_the_rest():
+    async def failing(limit, offset, **kwargs):
+        if offset == 100:
+            raise RuntimeError("nope")
+
+        await asyncio.sleep(0.01)
+        return {"items": list(range(offset, offset + limit)), "total": 500}
+
+    async def run():
+        paginator = Paginator(failing, concurrency=4)
+
+        with pytest.raises(RuntimeError):
+            await collect(paginator)
+
+        assert not paginator._pending
+
+    asyncio.run(run())
+
+
+def test_governor_limits_in_flight():
+    governor = Governor(window=2)
+    most = 0
+
+    async def request():
+        nonlocal most
+
+        async with governor:
+            most = max(most, governor.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*[request() for _ in range(10)])
+
+    asyncio.run(run())
+
+    assert most == 2
+    assert governor.in_flight == 0
+
+
+def test_governor_aimd():
+    governor = Governor(window=8, max_window=10)
+
+    for _ in range(100):
+        governor.succeeded()
+
+    assert governor.window == 10
+
+    governor.congested()
+    assert governor.window == 5
+
+    governor.congested(retry_after=60)
+    assert governor.window == 2.5
+
+    # a pile of failures from the same push back only halves it once
+    governor.congested(retry_after=60)
+    assert governor.window == 2.5
+
+
+def test_governor_retry_after_holds_everyone():
+    governor = Governor()
+
+    async def run():
+        governor.congested(retry_after=0.1)
+
+        start = time.monotonic()
+
+        async with governor:
+            return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_batcher_sync_and_async():
+    async def source():
+        for i in range(7):
+            yield i
+
+    async def run(items):
+        return [batch async for batch in Batcher(items, 3)]
+
+    assert asyncio.run(run(range(7))) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert asyncio.run(run(source())) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert asyncio.run(run([])) == []
+
+
+def test_batcher_timeout_sends_partial_batches():
+    async def slow():
+        yield 1
+        yield 2
+        await asyncio.sleep(0.2)
+        yield 3
+
+    async def run():
+        return [batch async for batch in Batcher(slow(), 10, timeout=0.05)]
+
+    assert asyncio.run(run()) == [[1, 2], [3]]
+
+
+def test_batcher_map_keeps_order_and_concurrency():
+    in_flight = most = 0
+
+    async def send(batch):
+        nonlocal in_flight, most
+
+        in_flight += 1
+        most = max(most, in_flight)
+
+        # later batches finish first
+        await asyncio.sleep(0.01 * (10 - batch[0]))
+
+        in_flight -= 1
+        return batch[0]
+
+    async def run():
+        return [result async for result in Batcher(range(10), 1).map(send, 3)]
+
+    assert asyncio.run(run()) == list(range(10))
+    assert most == 3
+
+
+def test_batcher_source_error():
+    async def source():
+        yield 1
+        raise RuntimeError("nope")
+
+    async def run():
+        return [batch async for batch in Batcher(source(), 10)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_pipeline_failure_only_skips_dependents():
+    ran = []
+    errors = []
+
+    def stage(name, fail=False):
+        async def run():
+            await asyncio.sleep(0)
+
+            if fail:
+                raise RuntimeError(name)
+
+            ran.append(name)
+
+        return run
+
+    pipeline = Pipeline(on_error=lambda name, e: errors.append(name))
+    pipeline.add("token", stage("token"))
+    pipeline.add("pull", stage("pull", fail=True))
+    pipeline.add("library", stage("library"), after=["token"])
+    pipeline.add("export", stage("export"), after=["library", "pull"])
+    pipeline.add("push", stage("push"), after=["export"])
+    pipeline.add("mirror", stage("mirror"), after=["library"])
+
+    assert asyncio.run(pipeline.run()) is False
+
+    assert sorted(ran) == ["library", "mirror", "token"]
+    assert list(pipeline.failed) == ["pull"] and errors == ["pull"]
+    assert sorted(pipeline.skipped) == ["export", "push"]
+
+
+def test_pipeline_runs_independent_stages_side_by_side():
+    pipeline = Pipeline()
+    started = []
+
+    async def stage():
+        started.append(time.monotonic())
+        await asyncio.sleep(0.05)
+
+    for name in "abc":
+        pipeline.add(name, stage)
+
+    assert asyncio.run(pipeline.run()) is True
+    assert max(started) - min(started) < 0.03
+
+
+def test_pipeline_unknown_dependency():
+    pipeline = Pipeline()
+
+    with pytest.raises(ValueError):
+        pipeline.add("export", lambda: None, after=["pull"])
+
+
+def test_pipeline_critical_path():
+    pipeline = Pipeline()
+
+    for name, after in (
+        ("token", ()),
+        ("pull", ()),
+        ("library", ("token",)),
+        ("albums", ("token",)),
+        ("export", ("pull", "library", "albums")),
+        ("mirror", ("library",)),
+        ("push", ("export",)),
+    ):
+        pipeline.add(name, None, after=after)
+
+    times = {
+        "token": [0, 1],
+        "pull": [0, 3],
+        "library": [1, 5],
+        "albums": [1, 4],
+        "export": [5, 8],
+        "mirror": [5, 6],
+        "push": [8, 9],
+    }
+
+    assert pipeline.critical_path(times) == ["token", "library", "export", "push"]
+
+    # stages that never ran are left out
+    del times["push"], times["token"], times["albums"]
+    times["library"] = [1, 2]
+
+    assert pipeline.critical_path(times) == ["pull", "export"]
+    assert pipeline.critical_path({}) == []
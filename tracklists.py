@@ -1,21 +1,30 @@
 import os
 import re
+import argparse
+import json
 import asyncio
 import logging
 import random
+import time
 
-from collections import namedtuple
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
-from typing import AsyncIterator
+from typing import AsyncIterator, Iterable, List, Optional, Set, Tuple
 
 from aiohttp import ClientSession
+from yarl import URL
 from fake_headers import Headers
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 from derw import makeLogger
 
 import spotify
 
+from spotify.store import Store
+from spotify.utils import Profiler
+
 log = makeLogger(__file__)
 log.setLevel(logging.DEBUG)
 
@@ -31,17 +40,176 @@ SPOTIFY_SCOPES = [
 ]
 SPOTIFY_REFRESH_TOKEN = os.environ.get("SPOTIFY_REFRESH_TOKEN")
 
+# talk to something other than api.spotify.com, ie. benchmarks/spotify_server.py
+SPOTIFY_API_URL = os.environ.get("SPOTIFY_API_URL")
+
+# local state kept between runs
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+
+# where to scrape from, ie. benchmarks/tracklists_server.py instead of the
+# real thing
+TRACKLISTS_URL = os.environ.get("TRACKLISTS_URL", "https://www.1001tracklists.com")
+
+# requests per second we allow ourselves against 1001tracklists, across all
+# DJs being scraped at once
+TRACKLISTS_RATE = float(os.environ.get("TRACKLISTS_RATE", 1 / 1.4))
+TRACKLISTS_BURST = int(os.environ.get("TRACKLISTS_BURST", 1))
+
+# every request also waits up to this much of the gap between requests
+# again, at random, so we don't look like a metronome
+TRACKLISTS_JITTER = float(os.environ.get("TRACKLISTS_JITTER", 0.3))
+
+# how many DJs to scrape at once
+DJ_CONCURRENCY = int(os.environ.get("DJ_CONCURRENCY", 3))
+
+# processes parsing pages off the event loop
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", 2))
+
 
 RE_MEDIA = re.compile(r"new MediaViewer\(this, .*, \{(.*)\} \);")
 
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+OVERVIEW_CLASSES = {"bItm", "action", "oItm"}
+
+
+def _is_overview_item(value: str) -> bool:
+    # while parsing, a strainer sees the whole class attribute as one string
+    return value is not None and not OVERVIEW_CLASSES.isdisjoint(value.split())
+
+
+# only the parts of each page we read get built into a tree
+DJ_PAGE = SoupStrainer(id=["left", "middle"])
+OVERVIEW = SoupStrainer(class_=_is_overview_item)
+MEDIA_ROWS = SoupStrainer(class_="mediaRow")
+
+
+# these run in the parse pool, so they have to live at module level and only
+# hand back plain data
+
+
+def _overview_items(soup: BeautifulSoup) -> List[Tuple[str, str]]:
+    return [
+        (item["data-id"], item.find(class_=["bTitle"]).find("a")["href"])
+        for item in soup.find_all(class_=list(OVERVIEW_CLASSES))
+    ]
+
+
+def parse_dj_page(html: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=DJ_PAGE)
+
+    # scrape DJ artist ID
+    dj_id = None
+    for link in soup.find(id="left").find_all("a"):
+        if link["href"].startswith("https://1001.tl/"):
+            dj_id = link["href"].replace("https://1001.tl/", "")
+
+    return dj_id, _overview_items(soup.find(id="middle"))
+
+
+def parse_overview(html: str) -> List[Tuple[str, str]]:
+    return _overview_items(BeautifulSoup(html, HTML_PARSER, parse_only=OVERVIEW))
+
+
+def parse_media(html: str) -> List[dict]:
+    medias = []
+
+    for item in reversed(
+        BeautifulSoup(html, HTML_PARSER, parse_only=MEDIA_ROWS).find_all(
+            class_="mediaRow"
+        )
+    ):
+        btn = item.select(".fa-spotify.mAction")
+        if not btn:
+            continue
+
+        media = list(filter(None, RE_MEDIA.findall(btn[0]["onclick"])))
+        if not media:
+            continue
+
+        medias.append(
+            {
+                m[0].strip(): m[1].strip()
+                for m in [l.split(":") for l in media[0].replace("'", "").split(",")]
+            }
+        )
+
+    return medias
+
 
 DJ = namedtuple("DJ", ("name", "playlist_id"))
 
 DJs = (DJ("missmonique", "62Wdnd2oq36OIRAQdf77OR"),)
 
+# how many new tracks to collect before adding them to the playlist and
+# checkpointing the crawl
+FLUSH_SIZE = 100
+
+# how many of the newest tracklists a finished crawl remembers to stop at,
+# so one of them being taken down doesn't send us through the whole history
+WATERMARK_SIZE = 5
+
+TRACK_IDS = spotify.Projection(spotify.ListTrack, "track.id")
+
+
+class TokenBucket:
+    """
+    Hands out `rate` tokens a second, saving up to `burst` of them. Waiters
+    are served in the order they showed up.
+
+    Every token also costs up to `jitter` of a token more, paid by whoever
+    comes next, so the gaps vary without ever getting shorter than the rate.
+    Being a share of the gap it keeps its say at any rate, and the rate
+    actually held to is steady_rate.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+
+        self._tokens: float = burst
+        self._updated = time.monotonic()
+        self._lock: asyncio.Lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill()
+
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+
+            self._tokens -= 1 + random.uniform(0, self.jitter)
+
+    @property
+    def steady_rate(self) -> float:
+        # once the burst is spent, on average
+        return self.rate / (1 + self.jitter / 2)
+
 
 class Session(ClientSession):
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(
+        self,
+        *args,
+        rate: float = TRACKLISTS_RATE,
+        burst: int = TRACKLISTS_BURST,
+        jitter: float = TRACKLISTS_JITTER,
+        **kwargs,
+    ) -> None:
         fake_headers = Headers(
             browser="chrome",  # Generate only Chrome UA
             os="win",  # Generate ony Windows platform
@@ -51,7 +219,6 @@ class Session(ClientSession):
         super().__init__(
             *args,
             headers={
-                "Host": "www.1001tracklists.com",
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
                 "Accept-Language": "en-US,en;q=0.5",
                 "Accept-Encoding": "gzip, deflate, br",
@@ -70,28 +237,119 @@ class Session(ClientSession):
             **kwargs,
         )
 
-        self._last_request_at = datetime.fromtimestamp(0)
-
-    async def _request(self, *args, **kwargs):
-        seconds_since_last = (datetime.utcnow() - self._last_request_at).total_seconds()
-        rand_next = random.uniform(1.2, 1.6)
-
-        if seconds_since_last < rand_next:
-            wait_for = rand_next - seconds_since_last
-            await asyncio.sleep(wait_for)
-
-        r = await super()._request(*args, **kwargs)
-
-        self._last_request_at = datetime.utcnow()
-
-        return r
+        # one bucket per host, shared by everything using this session
+        self._buckets = defaultdict(lambda: TokenBucket(rate, burst, jitter))
+
+    async def _pace(self, url: URL):
+        await self._buckets[url.host].acquire()
+
+    async def _request(self, method, str_or_url, *args, **kwargs):
+        await self._pace(URL(str_or_url))
+
+        return await super()._request(method, str_or_url, *args, **kwargs)
+
+
+class MediaLinkCache(Store):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS medialinks (
+        params TEXT PRIMARY KEY,
+        player_id TEXT NOT NULL
+    );
+    """
+
+    @staticmethod
+    def _key(params: dict) -> str:
+        return json.dumps(params, sort_keys=True)
+
+    def get(self, params: dict) -> str:
+        row = self._db.execute(
+            "SELECT player_id FROM medialinks WHERE params = ?", (self._key(params),)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def set(self, params: dict, player_id: str):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO medialinks (params, player_id) VALUES (?, ?)",
+                (self._key(params), player_id),
+            )
+
+
+class CrawlState(Store):
+    """
+    Where we got to with each DJ.
+
+    The watermarks are the newest few tracklists of the last crawl that ran
+    to the end, so the next one can stop at whichever of them it gets to
+    first. Until a crawl finishes, every tracklist whose tracks made it into
+    the playlist is recorded so an interrupted run picks up where it left
+    off.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS crawls (
+        dj TEXT NOT NULL,
+        pos INTEGER NOT NULL,
+        tracklist_id TEXT NOT NULL,
+        PRIMARY KEY (dj, pos)
+    );
+    CREATE TABLE IF NOT EXISTS processed (
+        dj TEXT NOT NULL,
+        tracklist_id TEXT NOT NULL,
+        PRIMARY KEY (dj, tracklist_id)
+    );
+    """
+
+    VERSION = 2
+    TABLES = ("crawls",)
+
+    def watermarks(self, dj: str) -> List[str]:
+        # newest first
+        return [
+            id
+            for (id,) in self._db.execute(
+                "SELECT tracklist_id FROM crawls WHERE dj = ? ORDER BY pos", (dj,)
+            )
+        ]
+
+    def processed(self, dj: str) -> Set[str]:
+        return {
+            id
+            for (id,) in self._db.execute(
+                "SELECT tracklist_id FROM processed WHERE dj = ?", (dj,)
+            )
+        }
+
+    def checkpoint(self, dj: str, tracklist_ids: Iterable[str]):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO processed (dj, tracklist_id) VALUES (?, ?)",
+                [(dj, id) for id in tracklist_ids],
+            )
+
+    def finish(self, dj: str, head: List[str]):
+        # whatever is new goes in front of what we stopped at before
+        head = list(dict.fromkeys([*head, *self.watermarks(dj)]))[:WATERMARK_SIZE]
+
+        with self._db:
+            self._db.execute("DELETE FROM crawls WHERE dj = ?", (dj,))
+            self._db.executemany(
+                "INSERT INTO crawls (dj, pos, tracklist_id) VALUES (?, ?, ?)",
+                [(dj, pos, id) for pos, id in enumerate(head)],
+            )
+
+            self._db.execute("DELETE FROM processed WHERE dj = ?", (dj,))
 
 
 class Tracklists:
-    BASE_URI = "https://www.1001tracklists.com"
+    BASE_URI = TRACKLISTS_URL
 
-    def __init__(self):
+    def __init__(self, medialinks: MediaLinkCache):
         self._http: Session
+        self._pool = ProcessPoolExecutor(PARSE_WORKERS)
+
+        self.medialinks = medialinks
 
     async def init(self):
         self._http = Session(
@@ -101,141 +359,283 @@ class Tracklists:
         # this will set the session cookie for later requests
         await self._http.get(self.BASE_URI)
 
-    async def get_songs(self, name: str) -> AsyncIterator[str]:
-        async for tl in self.get_tracklists(name):
-            log.info(f"Pulling list {tl}")
-            async for media in self.parse_tracklist(tl):
-                yield await self.get_medialink(media)
+    async def get_songs(self, url: str) -> List[str]:
+        log.info(f"Pulling list {url}")
+
+        return [
+            await self.get_medialink(media) async for media in self.parse_tracklist(url)
+        ]
 
-    async def get_tracklists(self, name: str) -> AsyncIterator[str]:
-        dj_id = None
+    async def _parse(self, func, html: str):
+        # soup is slow enough to stall every other DJ's requests, keep it off
+        # the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool, func, html
+        )
+
+    async def get_tracklists(
+        self, name: str, stop_at: Iterable[str] = ()
+    ) -> AsyncIterator[Tuple[str, str]]:
+        # newest first, so anything past stop_at we have already seen
+        stop_at = set(stop_at)
 
         async with self._http.get(f"{self.BASE_URI}/dj/{name}/") as r:
-            soup = BeautifulSoup(await r.text(), "html.parser")
+            dj_id, items = await self._parse(parse_dj_page, await r.text())
 
-            # scrape DJ artist ID
-            for link in soup.find(id="left").find_all("a"):
-                if link["href"].startswith("https://1001.tl/"):
-                    dj_id = link["href"].replace("https://1001.tl/", "")
+        count = 0
+        last_id = None
 
-            soup = soup.find(id="middle")
+        while True:
+            if last_id != None:
+                async with self._http.post(
+                    f"{self.BASE_URI}/ajax/get_data.php",
+                    data={
+                        "type": "overview",
+                        "dj": dj_id,
+                        "pos": count,
+                        "id": last_id,
+                        "count": 100,
+                    },
+                ) as r:
+                    data = await r.json()
 
-            count = 0
-            last_id = None
+                if data.get("end"):
+                    break
 
-            while True:
-                if last_id != None:
-                    async with self._http.post(
-                        f"{self.BASE_URI}/ajax/get_data.php",
-                        data={
-                            "type": "overview",
-                            "dj": dj_id,
-                            "pos": count,
-                            "id": last_id,
-                            "count": 100,
-                        },
-                    ) as r:
-                        data = await r.json()
+                items = await self._parse(parse_overview, data["data"])
 
-                        if data.get("end"):
-                            break
+            # nothing (more) to page through. without this, a DJ with no
+            # tracklists at all has us going round without ever awaiting
+            if not items:
+                break
 
-                        soup = BeautifulSoup(data["data"], "html.parser")
+            for last_id, href in items:
+                count += 1
 
-                for item in soup.find_all(class_=["bItm", "action", "oItm"]):
-                    last_id = item["data-id"]
-                    count += 1
+                if last_id in stop_at:
+                    return
 
-                    yield item.find(class_=["bTitle"]).find("a")["href"]
+                yield last_id, href
 
-                await asyncio.sleep(1)
+        if stop_at:
+            log.warning(
+                f"None of the tracklists {name}'s last crawl stopped at are "
+                f"listed anymore, went through all {count} of them"
+            )
 
     async def parse_tracklist(self, url) -> AsyncIterator[dict]:
         async with self._http.get(f"{self.BASE_URI}{url}") as r:
-            for item in reversed(
-                BeautifulSoup(await r.text(), "html.parser").find_all(class_="mediaRow")
-            ):
-                btn = item.select(".fa-spotify.mAction")
-                if not btn:
-                    continue
-
-                media = list(filter(None, RE_MEDIA.findall(btn[0]["onclick"])))
-                if not media:
-                    continue
-
-                yield {
-                    m[0].strip(): m[1].strip()
-                    for m in [
-                        l.split(":") for l in media[0].replace("'", "").split(",")
-                    ]
-                }
+            html = await r.text()
+
+        for media in await self._parse(parse_media, html):
+            yield media
 
     async def get_medialink(self, params) -> str:
-        async with self._http.get(
-            f"{self.BASE_URI}/ajax/get_medialink.php", params=params
-        ) as r:
-            data = await r.json()
-            return data["data"][0]["playerId"]
+        # these never change, and every one we skip saves us the request and
+        # the wait in front of it
+        player_id = self.medialinks.get(params)
+
+        if player_id is None:
+            async with self._http.get(
+                f"{self.BASE_URI}/ajax/get_medialink.php", params=params
+            ) as r:
+                data = await r.json()
+                player_id = data["data"][0]["playerId"]
+
+            self.medialinks.set(params, player_id)
+
+        return player_id
 
     async def close(self) -> None:
         await self._http.close()
+        self._pool.shutdown()
+        self.medialinks.close()
 
 
 class Core:
-    def __init__(self) -> None:
+    def __init__(self, profile: bool = False, lag_threshold: float = 0.1) -> None:
+        # parsing happens in the pool, so this is mostly the loop's side of it
+        self.profiler = (
+            Profiler(
+                os.path.join(CACHE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}"),
+                lag_threshold,
+                on_block=log.warning,
+            )
+            if profile
+            else None
+        )
+
         self.spotify = spotify.SpotifyClient(
             SPOTIFY_CLIENT_ID,
             SPOTIFY_CLIENT_SECRET,
             SPOTIFY_SCOPES,
             SPOTIFY_REDIRECT_URI,
             SPOTIFY_REFRESH_TOKEN,
+            base_url=SPOTIFY_API_URL,
         )
 
-        self.tracklists = Tracklists()
+        self.tracklists = Tracklists(
+            MediaLinkCache(os.path.join(CACHE_DIR, "tracklists.db"))
+        )
+        self.crawls = CrawlState(os.path.join(CACHE_DIR, "tracklists.db"))
 
     async def init(self):
         await self.spotify.refresh_token()
         await self.tracklists.init()
 
+    def stage(self, name: str):
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
     async def run(self):
-        await self.init()
+        if self.profiler:
+            self.profiler.start()
+
+        with self.stage("init"):
+            await self.init()
 
         me = await self.spotify.user.me()
 
         log.info(f"Logged in as {me.display_name} ({me.id})")
 
-        for dj in DJs:
-            log.info(f"Scraping {dj.name}")
+        slots = asyncio.Semaphore(DJ_CONCURRENCY)
+
+        async def scrape(dj: DJ):
+            async with slots:
+                await self.scrape(dj)
+
+        # the session's token bucket keeps the combined request rate in check
+        with self.stage("scrape"):
+            await asyncio.gather(*[scrape(dj) for dj in DJs])
+
+    async def scrape(self, dj: DJ):
+        log.info(f"Scraping {dj.name}")
+
+        # scraping and the spotify side run side by side, with the
+        # tracklists handed over through the queue
+        queue: asyncio.Queue = asyncio.Queue()
+
+        tasks = [
+            asyncio.ensure_future(self.scrape_tracklists(dj, queue)),
+            asyncio.ensure_future(self.add_scraped(dj, queue)),
+        ]
+
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
 
-            new_track_ids = set()
+        for task in done:
+            task.result()
 
-            tracks: list[spotify.Track] = [
-                track.track
-                async for track in self.spotify.playlists.get_tracks(dj.playlist_id)
-            ]
+        head, added = (task.result() for task in tasks)
 
-            async for trackid in self.tracklists.get_songs(dj.name):
-                if list(filter(lambda x: x.id == trackid, tracks)):
-                    continue
+        self.crawls.finish(dj.name, head)
 
-                new_track_ids.add(trackid)
+        log.info(f"Added {added} tracks for {dj.name}")
 
-            new_track_uris = [
-                track.uri
-                async for track in self.spotify.track.get_several(list(new_track_ids))
-            ]
+    async def scrape_tracklists(self, dj: DJ, queue: asyncio.Queue) -> List[str]:
+        watermarks = self.crawls.watermarks(dj.name)
+        processed = self.crawls.processed(dj.name)
 
-            await self.spotify.playlists.add_tracks(dj.playlist_id, new_track_uris)
+        if processed:
+            log.info(f"Resuming {dj.name}, {len(processed)} tracklists already done")
 
-            log.info(f"Added {len(new_track_uris)} tracks for {dj.name}")
+        # the newest ones, for the next crawl to stop at
+        head: List[str] = []
+
+        async for tl_id, url in self.tracklists.get_tracklists(
+            dj.name, stop_at=watermarks
+        ):
+            if len(head) < WATERMARK_SIZE:
+                head.append(tl_id)
+
+            if tl_id in processed:
+                continue
+
+            await queue.put((tl_id, await self.tracklists.get_songs(url)))
+
+        await queue.put(None)
+
+        return head
+
+    async def add_scraped(self, dj: DJ, queue: asyncio.Queue) -> int:
+        # all we need to know about the playlist is what's already in it
+        known: Set[str] = {
+            track.track.id
+            async for track in self.spotify.playlists.get_tracks(
+                dj.playlist_id, projection=TRACK_IDS
+            )
+        }
+
+        added = 0
+
+        new_track_ids = set()
+        pending: list[str] = []
+
+        while True:
+            item = await queue.get()
+
+            if item is None:
+                break
+
+            tl_id, songs = item
+
+            new_track_ids.update(trackid for trackid in songs if trackid not in known)
+
+            pending.append(tl_id)
+
+            if len(new_track_ids) >= FLUSH_SIZE:
+                added += await self.add_tracks(dj, known, new_track_ids)
+                self.crawls.checkpoint(dj.name, pending)
+
+                new_track_ids = set()
+                pending = []
+
+        # what's left is covered by finish(), which runs once this returns
+        added += await self.add_tracks(dj, known, new_track_ids)
+
+        return added
+
+    async def add_tracks(self, dj: DJ, known: Set[str], track_ids: Set[str]) -> int:
+        if not track_ids:
+            return 0
+
+        # medialinks hand us track ids, no need to look them up for the uri
+        await self.spotify.playlists.add_tracks(
+            dj.playlist_id, [f"spotify:track:{id}" for id in sorted(track_ids)]
+        )
+
+        known.update(track_ids)
+
+        return len(track_ids)
 
     async def close(self):
+        if self.profiler:
+            await self.profiler.stop()
+            log.info(f"Profiles written to {self.profiler.directory}")
+
         await self.spotify.api.close_client()
         await self.tracklists.close()
+        self.crawls.close()
 
 
 if __name__ == "__main__":
-    app = Core()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="cProfile the run and watch for a blocked event loop",
+    )
+    parser.add_argument(
+        "--lag-threshold",
+        type=float,
+        default=0.1,
+        help="seconds the loop can be blocked before --profile complains",
+    )
+    args = parser.parse_args()
+
+    app = Core(profile=args.profile, lag_threshold=args.lag_threshold)
     loop = asyncio.new_event_loop()
 
     try:
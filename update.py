@@ -1,23 +1,44 @@
 import os
 import re
+import json
 import asyncio
+import hashlib
 import traceback
 import glob
+import time
+import tempfile
+import fnmatch
 import logging
+import argparse
 
+from collections import Counter, namedtuple
+from contextlib import nullcontext
 from datetime import date, datetime, timedelta, timezone
-from typing import List
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Set, Tuple, Union
 from urllib.parse import urlparse, urlunparse
 
 import aiofiles
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 from derw import makeLogger
 
 import spotify
 
+from spotify.utils import Pipeline, Profiler
+
 log = makeLogger(__file__)
 log.setLevel(logging.DEBUG)
 
+
+def env_flag(name: str) -> bool:
+    # so that SOMETHING=0 or SOMETHING=false turn it off instead of on
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
 # SPOTIFY
 SPOTIFY_CLIENT_ID = os.environ.get("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.environ.get("SPOTIFY_CLIENT_SECRET")
@@ -32,48 +53,125 @@ SPOTIFY_REFRESH_TOKEN = os.environ.get("SPOTIFY_REFRESH_TOKEN")
 
 SPOTIFY_MIRROR_PLAYLIST = os.environ.get("SPOTIFY_MIRROR_PLAYLIST")
 
+# talk to something other than api.spotify.com, ie. benchmarks/spotify_server.py
+SPOTIFY_API_URL = os.environ.get("SPOTIFY_API_URL")
+
+# how many pages to fetch at once when paging through big lists
+SPOTIFY_CONCURRENCY = int(os.environ.get("SPOTIFY_CONCURRENCY", 8))
+
+# skip pydantic validation and use the plain records from spotify.records
+SPOTIFY_LEAN = env_flag("SPOTIFY_LEAN")
+
+# how many playlists to export at once
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", 4))
+
+# only log what purging the idk playlists would do
+PURGE_DRY_RUN = env_flag("PURGE_DRY_RUN")
+
+# local state kept between runs
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+
+# every run appends a line of JSON here: stage timings and what each
+# spotify endpoint cost us
+METRICS_REPORT = os.environ.get("METRICS_REPORT", os.path.join(CACHE_DIR, "runs.jsonl"))
+
+# the last run in the prometheus text format, ie. for node_exporter's
+# textfile collector
+METRICS_PROMETHEUS = os.environ.get("METRICS_PROMETHEUS")
+
 # GIT
 GIT_REPO = os.environ.get("GIT_REPO")
 GIT_COMMITTER_NAME = os.environ.get("GIT_COMMITTER_NAME")
 GIT_COMMITTER_EMAIL = os.environ.get("GIT_COMMITTER_EMAIL")
 GIT_PASSWORD = os.environ.get("GIT_PASSWORD")
 
+# commit through git fast-import instead of the working tree
+GIT_PLUMBING = env_flag("GIT_PLUMBING")
+
 RE_MARKDOWN = re.compile(r"\|")
 
+# how much of a file we hold in memory at once while exporting
+CHUNK_SIZE = 1 << 16
+
+# the mirror diff only ever looks at the uri
+MIRROR_PROJECTION = spotify.Projection(spotify.ListTrack, "track.uri")
+
 
 class Git:
     def __init__(self):
         self.dir = os.path.abspath(GIT_REPO)
 
-    async def _run_command(self, command):
+    async def _run_command(self, command, input: str = None):
         proc = await asyncio.create_subprocess_shell(
             command,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
             cwd=self.dir,
         )
 
-        stdout, stderr = await proc.communicate()
+        stdout, stderr = await proc.communicate(input.encode() if input else None)
 
         if stderr and proc.returncode != 0:
             raise Exception(f'Command "{command}" failed: {stderr.decode().strip()}')
 
         return stdout.decode().strip()
 
+    async def _origin(self) -> str:
+        origin = await self._run_command("git remote get-url origin")
+
+        parts = urlparse(origin)
+
+        if GIT_PASSWORD and parts.scheme in ("http", "https"):
+            parts = parts._replace(
+                netloc=f"{GIT_COMMITTER_NAME}:{GIT_PASSWORD}@{parts.netloc}"
+            )
+
+        return urlunparse(parts)
+
     async def pull(self):
         await self._run_command("git reset HEAD --hard")
         await self._run_command("git pull --quiet")
 
-    async def commit_and_push(self):
-        # check if we need to make a commit
-        diff = await self._run_command("git diff --numstat")
+    def output(self) -> "Output":
+        return FileOutput(self.dir, os.path.join(CACHE_DIR, "export.json"))
+
+    async def commit_and_push(self, paths: Iterable[str], written: Iterable[str] = ()):
+        # removing a file that was never committed leaves a path that matches
+        # nothing, and git add gives up on all of them over it
+        tracked = set((await self._run_command("git ls-files -z")).split("\0"))
+
+        paths = {
+            path
+            for path in paths
+            if path in tracked or os.path.exists(os.path.join(self.dir, path))
+        }
+
+        # a run that died before its commit leaves new files behind, and the
+        # reset in pull doesn't touch them. this run writes the same thing so
+        # they don't count as changed, but they still need committing
+        paths.update(
+            path
+            for path in written
+            if path not in tracked and os.path.exists(os.path.join(self.dir, path))
+        )
+
+        paths = sorted(paths)
 
-        if not len(diff):
+        if not paths:
             log.info("No changes, commit not needed")
             return
 
-        # Add all files
-        await self._run_command("git add -A .")
+        # Only stage what we actually touched, deletions included
+        await self._run_command(
+            "git --literal-pathspecs add -A --pathspec-from-file=-",
+            input="\n".join(paths),
+        )
+
+        # rewriting a file back to what's committed leaves nothing to commit
+        if not await self._run_command("git diff --cached --name-only"):
+            log.info("No changes, commit not needed")
+            return
 
         # Create commit
         await self._run_command(
@@ -83,16 +181,299 @@ class Git:
         log.info(f"Created commit {commit_id}")
 
         # Create push
-        origin = await self._run_command("git remote get-url origin")
+        await self._run_command(f"git push {await self._origin()} master --porcelain")
 
-        parts = urlparse(origin)
-        parts = parts._replace(
-            netloc=f"{GIT_COMMITTER_NAME}:{GIT_PASSWORD}@{parts.netloc}"
+    async def close(self):
+        pass
+
+
+class GitImport(Git):
+    """
+    Commits the export straight into the object store on top of whatever
+    origin has, streaming blobs through a single git fast-import as they are
+    rendered. Neither the checkout nor the index is ever looked at, so
+    GIT_REPO can just as well be a bare clone.
+    """
+
+    REF = "refs/dews/export"
+
+    def __init__(self):
+        super().__init__()
+
+        self.parent: str = None
+        self.tree: Dict[str, str] = {}
+
+        self._proc: asyncio.subprocess.Process = None
+        self._lock = asyncio.Lock()
+        self._marks = 0
+        self._changes: List[bytes] = []
+
+    async def pull(self):
+        await self._run_command(f"git fetch --quiet {await self._origin()} master")
+
+        self.parent = await self._run_command("git rev-parse --verify FETCH_HEAD")
+
+        # what every path in the parent holds, so unchanged files never have
+        # to be sent at all
+        for entry in (await self._run_command("git ls-tree -r -z FETCH_HEAD")).split("\0"):
+            if entry:
+                info, path = entry.split("\t", 1)
+                self.tree[path] = info.split()[2]
+
+        # --done makes it throw everything away if we die half way through
+        self._proc = await asyncio.create_subprocess_exec(
+            "git",
+            "fast-import",
+            "--quiet",
+            "--done",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.dir,
+        )
+
+    def output(self) -> "Output":
+        return TreeOutput(self)
+
+    async def _send(self, data: bytes):
+        self._proc.stdin.write(data)
+        await self._proc.stdin.drain()
+
+    async def blob(self, path: str, file: str):
+        # a blob goes over in chunks, don't let another export cut in
+        async with self._lock:
+            self._marks += 1
+
+            await self._send(
+                b"blob\nmark :%d\ndata %d\n" % (self._marks, os.path.getsize(file))
+            )
+
+            async with aiofiles.open(file, "rb") as f:
+                while chunk := await f.read(CHUNK_SIZE):
+                    await self._send(chunk)
+
+            await self._send(b"\n")
+
+        self._changes.append(b"M 100644 :%d %s\n" % (self._marks, path.encode()))
+
+    def delete(self, path: str):
+        self._changes.append(b"D %s\n" % path.encode())
+
+    async def commit_and_push(self, paths: Iterable[str], written: Iterable[str] = ()):
+        # everything is compared against origin's tree, so nothing can be
+        # left behind by a run that didn't get to commit
+        if not self._changes:
+            log.info("No changes, commit not needed")
+            await self._finish()
+            return
+
+        message = str(date.today()).encode()
+        ident = f"{GIT_COMMITTER_NAME} <{GIT_COMMITTER_EMAIL}> {int(time.time())} +0000"
+
+        await self._send(
+            b"".join(
+                [
+                    b"commit %s\n" % self.REF.encode(),
+                    b"author %s\n" % ident.encode(),
+                    b"committer %s\n" % ident.encode(),
+                    b"data %d\n%s\n" % (len(message), message),
+                    b"from %s\n" % self.parent.encode(),
+                    *self._changes,
+                    b"\n",
+                ]
+            )
         )
+        await self._finish()
 
-        origin = urlunparse(parts)
+        commit_id = await self._run_command(f"git rev-parse --verify {self.REF}")
+        log.info(f"Created commit {commit_id}")
+
+        await self._run_command(
+            f"git push {await self._origin()} {commit_id}:refs/heads/master --porcelain"
+        )
+
+    async def _finish(self):
+        await self._send(b"done\n")
+        self._proc.stdin.close()
+
+        _, stderr = await self._proc.communicate()
+
+        if self._proc.returncode != 0:
+            raise Exception(f"git fast-import failed: {stderr.decode().strip()}")
+
+    async def close(self):
+        # still running means the run never got as far as the commit. it
+        # holds a lock on the repo until it's gone, and --done has it throw
+        # away whatever it got
+        if self._proc and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+
+
+def blob_id(file: str) -> str:
+    # the same id git gives the file
+    h = hashlib.sha1(b"blob %d\0" % os.path.getsize(file))
+
+    with open(file, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+async def _once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+class Output:
+    """
+    Takes the rendered export and only passes on files whose content
+    changed, plus removals for the ones that are gone.
+    """
+
+    def __init__(self):
+        self.written: Set[str] = set()
+        self.changed: Set[str] = set()
+
+    async def write(self, path: str, content: str):
+        await self.write_stream(path, _once(content.encode()))
+
+    async def write_stream(self, path: str, chunks: AsyncIterable[bytes]):
+        # everything goes through a staging file first, so we never need to
+        # hold a whole file to know whether it changed
+        staged = self._stage(path)
+
+        try:
+            async with aiofiles.open(staged, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+
+            id = blob_id(staged)
+
+            self.written.add(path)
+
+            if self._current(path) != id:
+                await self._write(path, staged)
+                self.changed.add(path)
+
+            self._remember(path, id)
+
+        finally:
+            if os.path.exists(staged):
+                os.remove(staged)
+
+    def remove_stale(self, directory: str, pattern: str = "*"):
+        # anything in here we didn't write this run belongs to something
+        # that's gone
+        for path in self._list(directory, pattern):
+            if path in self.written:
+                continue
+
+            self._remove(path)
+            self.changed.add(path)
+
+    def save(self):
+        pass
+
+    def _stage(self, path: str) -> str:
+        fd, staged = tempfile.mkstemp(prefix="dews-")
+        os.close(fd)
+        return staged
+
+    def _remember(self, path: str, id: str):
+        pass
+
+
+class FileOutput(Output):
+    """
+    Writes into the checkout. The manifest remembers what we last wrote, so
+    files that haven't been touched since don't even need to be read back.
+    """
+
+    def __init__(self, root: str, manifest: str):
+        super().__init__()
+
+        self.root = root
+        self.manifest_path = manifest
+
+        try:
+            with open(manifest) as f:
+                self.manifest: dict = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.manifest = {}
+
+    def _current(self, path: str) -> str:
+        try:
+            st = os.stat(os.path.join(self.root, path))
+        except FileNotFoundError:
+            return None
+
+        entry = self.manifest.get(path)
+
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+            return entry["id"]
+
+        return blob_id(os.path.join(self.root, path))
+
+    def _remember(self, path: str, id: str):
+        st = os.stat(os.path.join(self.root, path))
+        self.manifest[path] = {"id": id, "size": st.st_size, "mtime": st.st_mtime_ns}
+
+    def _stage(self, path: str) -> str:
+        # next to the real thing so it can be moved into place
+        file = os.path.join(self.root, path)
+
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        return os.path.join(os.path.dirname(file), f".{os.path.basename(file)}.tmp")
+
+    async def _write(self, path: str, staged: str):
+        os.replace(staged, os.path.join(self.root, path))
+
+    def _list(self, directory: str, pattern: str) -> List[str]:
+        return [
+            os.path.relpath(file, self.root)
+            for file in glob.glob(os.path.join(self.root, directory, pattern))
+        ]
+
+    def _remove(self, path: str):
+        os.remove(os.path.join(self.root, path))
+        self.manifest.pop(path, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.manifest, f)
+
+
+class TreeOutput(Output):
+    """
+    Compares against the tree we are committing on top of and hands whatever
+    changed to fast-import.
+    """
+
+    def __init__(self, git: GitImport):
+        super().__init__()
+
+        self.git = git
+
+    def _current(self, path: str) -> str:
+        return self.git.tree.get(path)
+
+    async def _write(self, path: str, staged: str):
+        await self.git.blob(path, staged)
+
+    def _list(self, directory: str, pattern: str) -> List[str]:
+        return [
+            path
+            for path in self.git.tree
+            if os.path.dirname(path) == directory
+            and fnmatch.fnmatch(os.path.basename(path), pattern)
+        ]
 
-        await self._run_command(f"git push {origin} master --porcelain")
+    def _remove(self, path: str):
+        self.git.delete(path)
 
 
 def make_csv(d: List[str]):
@@ -109,10 +490,134 @@ def make_csv(d: List[str]):
     return ",".join(ret)
 
 
+TRACK_FIELDS = ["title", "album", "artist", "id", "url"]
+
+ArtistRow = namedtuple("ArtistRow", ("name", "id", "url", "md"))
+AlbumRow = namedtuple("AlbumRow", ("name", "artist", "id", "url", "md"))
+
+
+def track_row(track: spotify.ListTrack) -> List[str]:
+    return [
+        track.track.name,
+        track.track.album.name,
+        ", ".join(artist.name for artist in track.track.artists),
+        track.track.id,
+        track.track.url,
+    ]
+
+
+async def csv_chunks(
+    fields: List[str], rows: Union[Iterable, AsyncIterable]
+) -> AsyncIterator[bytes]:
+    # a chunk of lines at a time, so a big export never sits in memory whole
+    buf = [make_csv(fields) + "\n"]
+    size = len(buf[0])
+
+    if not hasattr(rows, "__aiter__"):
+        rows = _aiter(rows)
+
+    async for row in rows:
+        line = make_csv(row) + "\n"
+
+        buf.append(line)
+        size += len(line)
+
+        if size >= CHUNK_SIZE:
+            yield "".join(buf).encode()
+
+            buf = []
+            size = 0
+
+    if buf:
+        yield "".join(buf).encode()
+
+
+def csv_names(playlists: List[spotify.Playlist]) -> List[str]:
+    names = [re.sub(r"[^\w\d\s-]", "_", playlist.name) for playlist in playlists]
+
+    # playlists that come out the same (case aside, for filesystems that
+    # ignore it) would overwrite each other, so those get their id as well
+    taken = Counter(name.lower() for name in names)
+
+    return [
+        f"{name} ({playlist.id})" if taken[name.lower()] > 1 else name
+        for name, playlist in zip(names, playlists)
+    ]
+
+
+async def _aiter(rows: Iterable) -> AsyncIterator:
+    for row in rows:
+        yield row
+
+
+class PurgePlan:
+    """
+    What purging the idk playlists comes down to: the tracks to save to the
+    library across all of them, and what to take out of each one.
+    """
+
+    # what spotify takes per request
+    LIBRARY_BATCH = 50
+    PLAYLIST_BATCH = 100
+
+    def __init__(self, cutoff: datetime):
+        self.cutoff = cutoff
+
+        # id -> when it was first added to any of them
+        self.saves: Dict[str, datetime] = {}
+        self.removals: List[Tuple[spotify.Playlist, List[str]]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.removals)
+
+    def add(self, playlist: spotify.Playlist, tracks: List[spotify.ListTrack]):
+        old = [t for t in tracks if t.added_at <= self.cutoff]
+
+        if not old:
+            return
+
+        for t in old:
+            if t.track.id not in self.saves or t.added_at < self.saves[t.track.id]:
+                self.saves[t.track.id] = t.added_at
+
+        self.removals.append(
+            (playlist, list(dict.fromkeys(t.track.uri for t in old)))
+        )
+
+    def library_ids(self) -> List[str]:
+        return sorted(self.saves, key=self.saves.__getitem__)
+
+    @property
+    def calls(self) -> int:
+        # the saves, then the removals
+        return -(-len(self.saves) // self.LIBRARY_BATCH) + sum(
+            -(-len(uris) // self.PLAYLIST_BATCH) for _, uris in self.removals
+        )
+
+
 class DewsBeats:
-    def __init__(self):
-        self.saved_tracks: List[spotify.ListTrack]
+    def __init__(self, profile: bool = False, lag_threshold: float = 0.1):
         self.playlists: List[spotify.Playlist]
+        self.artists: List[ArtistRow]
+        self.albums: List[AlbumRow]
+
+        self.metrics = spotify.Metrics()
+        self.pipeline: Pipeline = None
+        self.git: Git = None
+
+        # profiles go next to the run report
+        self.profiler = (
+            Profiler(
+                os.path.join(
+                    os.path.dirname(METRICS_REPORT) or ".",
+                    f"profile-{datetime.now():%Y%m%d-%H%M%S}",
+                ),
+                lag_threshold,
+                on_block=log.warning,
+            )
+            if profile
+            else None
+        )
 
         self.spotify = spotify.SpotifyClient(
             SPOTIFY_CLIENT_ID,
@@ -120,79 +625,171 @@ class DewsBeats:
             SPOTIFY_SCOPES,
             SPOTIFY_REDIRECT_URI,
             SPOTIFY_REFRESH_TOKEN,
+            lean=SPOTIFY_LEAN,
+            json_loads=json_loads,
+            base_url=SPOTIFY_API_URL,
+            metrics=self.metrics,
         )
 
-    async def main(self):
-        try:
-            await self.spotify.refresh_token()
+        self._export_slots = asyncio.Semaphore(EXPORT_CONCURRENCY)
+
+        self.library = spotify.LibraryStore(
+            os.path.join(CACHE_DIR, "library.db"), lean=SPOTIFY_LEAN
+        )
+        self.playlist_cache = spotify.PlaylistStore(
+            os.path.join(CACHE_DIR, "playlists.db"), lean=SPOTIFY_LEAN
+        )
 
-            self.git = Git()
-            await self.git.pull()
+    async def main(self):
+        ok = False
 
-            me = await self.spotify.user.me()
+        if self.profiler:
+            self.profiler.start()
 
-            log.info(f"Logged in as {me.display_name} ({me.id})")
+        try:
+            self.git = GitImport() if GIT_PLUMBING else Git()
 
-            self.saved_tracks = list(
-                [track async for track in self.spotify.library.get_tracks()]
+            # every stage starts once the ones it needs are done, so git and
+            # the different bits of spotify all go at once
+            pipeline = self.pipeline = Pipeline(
+                self.metrics.stage, on_error=self._stage_failed
             )
-            self.saved_tracks.sort(key=lambda x: x.added_at)
 
-            self.playlists = list(
-                [pl async for pl in self.spotify.playlists.current_get_all()]
+            pipeline.add("refresh_token", self.spotify.refresh_token)
+            pipeline.add("git_pull", self.git.pull)
+
+            pipeline.add("get_user", self.get_user, after=["refresh_token"])
+            pipeline.add("library_sync", self.sync_library, after=["refresh_token"])
+            pipeline.add("get_playlists", self.get_playlists, after=["refresh_token"])
+            pipeline.add("get_artists", self.get_artists, after=["refresh_token"])
+            pipeline.add("get_albums", self.get_albums, after=["refresh_token"])
+
+            # the purge saves tracks to the library, which would move the
+            # pages out from under a sync that's still going
+            pipeline.add(
+                "purge_idk_playlists",
+                self.purge_idk_playlists,
+                after=["library_sync", "get_playlists"],
+            )
+            pipeline.add(
+                "update_playlist",
+                self.update_playlist,
+                after=["library_sync", "get_playlists"],
             )
-            self.playlists.sort(key=lambda x: x.name)
-
-            await self.purge_idk_playlists()
 
-            await self.update_playlist()
+            # the idk playlists get exported as they are after the purge
+            pipeline.add(
+                "update_git",
+                self.update_git,
+                after=[
+                    "git_pull",
+                    "library_sync",
+                    "get_playlists",
+                    "purge_idk_playlists",
+                    "get_artists",
+                    "get_albums",
+                ],
+            )
+            pipeline.add(
+                "commit_and_push",
+                lambda: self.git.commit_and_push(
+                    self.output.changed, self.output.written
+                ),
+                after=["update_git"],
+            )
 
-            await self.update_git()
+            # cProfile can only follow one stage at a time and the stages
+            # overlap, so the run gets profiled as a whole
+            with self.profiler.stage("run") if self.profiler else nullcontext():
+                ok = await pipeline.run()
 
-            await self.git.commit_and_push()
+            if pipeline.skipped:
+                log.warning(f"Skipped {', '.join(pipeline.skipped)}")
 
-        except:
+        except Exception:
             traceback.print_exc()
 
         finally:
+            self.metrics.finish(ok)
+
             await self.close()
 
+            if self.profiler:
+                await self.profiler.stop()
+                log.info(f"Profiles written to {self.profiler.directory}")
+
+            self.write_report()
+
+    def _stage_failed(self, name: str, error: BaseException):
+        log.error(f"{name} failed", exc_info=error)
+
+    async def get_user(self):
+        me = await self.spotify.user.me()
+
+        log.info(f"Logged in as {me.display_name} ({me.id})")
+
+    async def sync_library(self):
+        await self.library.sync(self.spotify.library, concurrency=SPOTIFY_CONCURRENCY)
+
+    async def get_playlists(self):
+        self.playlists = [
+            pl
+            async for pl in self.spotify.playlists.current_get_all(
+                concurrency=SPOTIFY_CONCURRENCY
+            )
+        ]
+        self.playlists.sort(key=lambda x: x.name)
+
+        self.playlist_cache.evict(pl.id for pl in self.playlists)
+
     async def purge_idk_playlists(self):
         log.debug("Purging idk playlists")
 
-        for playlist in self.playlists:
-            if not playlist.name.startswith("idk"):
-                continue
+        idk = [pl for pl in self.playlists if pl.name.startswith("idk")]
 
-            tracks: List[str] = []
+        plan = PurgePlan(datetime.now(timezone.utc) - timedelta(weeks=2))
 
-            async for track in self.spotify.playlists.get_tracks(playlist.id):
-                if track.added_at > datetime.now(timezone.utc) - timedelta(weeks=2):
-                    continue
+        for playlist, tracks in zip(
+            idk,
+            await asyncio.gather(
+                *[
+                    self.playlist_cache.get_tracks(
+                        self.spotify.playlists, playlist, concurrency=SPOTIFY_CONCURRENCY
+                    )
+                    for playlist in idk
+                ]
+            ),
+        ):
+            plan.add(playlist, tracks)
 
-                tracks.append(track)
+        log.debug(
+            f"- {len(plan.saves)} track(s) from {len(plan.removals)} playlist(s) "
+            f"in {plan.calls} call(s)"
+        )
 
-            if not tracks:
-                continue
+        if PURGE_DRY_RUN or not plan:
+            return
 
-            tracks.sort(key=lambda x: x.added_at)
+        # everything has to be saved before anything is taken out. one pass
+        # oldest first, so the library keeps the order they were added in
+        await self.spotify.library.add_tracks(plan.library_ids())
 
-            ids = list(map(lambda x: x.track.id, tracks))
-            await self.spotify.library.add_tracks(ids)
+        await asyncio.gather(
+            *[self.remove_purged(playlist, uris) for playlist, uris in plan.removals]
+        )
 
-            uris = list(map(lambda x: x.track.uri, tracks))
-            await self.spotify.playlists.remove_tracks(playlist.id, uris)
+    async def remove_purged(self, playlist: spotify.Playlist, uris: List[str]):
+        # we just changed it, so the snapshot we listed is stale
+        playlist.snapshot_id = await self.spotify.playlists.remove_tracks(playlist.id, uris)
 
-            log.debug(f"- {len(tracks)} track(s) from {playlist.name}")
+        log.debug(f"- {len(uris)} track(s) from {playlist.name}")
 
     async def update_git(self):
         log.debug("Updating Git")
 
-        _dir = os.path.relpath(GIT_REPO)
-
-        lib_md = await aiofiles.open(os.path.join(_dir, "LIBRARY.md"), "w")
+        self.output = self.git.output()
 
-        await lib_md.writelines("# Library\n\n")
+        lib_md: List[str] = ["# Library\n\n"]
 
         # ================================
         #    SAVED TRACKS & PLAYLISTS
@@ -200,75 +797,39 @@ class DewsBeats:
 
         log.debug("- Saved Tracks")
 
-        data = [
-            {
-                "title": track.track.name,
-                "album": track.track.album.name,
-                "artist": ", ".join(artist.name for artist in track.track.artists),
-                "id": track.track.id,
-                "url": track.track.url,
-            }
-            for track in self.saved_tracks
-        ]
-
-        await self.write_csv(os.path.join(_dir, "Saved Songs.csv"), data)
-
-        # delete playlist csv files and then re-populate for ez deletion handling
-        playlist_dir = os.path.join(_dir, "playlists")
-        for filename in glob.glob(f"{playlist_dir}/*.csv"):
-            os.remove(filename)
-
-        await lib_md.write("## Playlists\n\n")
-        await lib_md.write("|Name|Author|Description||\n")
-        await lib_md.write("--- | --- | --- | ---\n")
+        # streamed straight out of the store, sqlite does the sorting. a
+        # table would mean holding the whole library for one pass over it
+        await self.write_csv(
+            "Saved Songs.csv", map(track_row, self.library.iter()), TRACK_FIELDS
+        )
 
-        for playlist in self.playlists:
-            log.debug(f"- Playlist {playlist.name}")
+        lib_md.append("## Playlists\n\n")
+        lib_md.append("|Name|Author|Description||\n")
+        lib_md.append("--- | --- | --- | ---\n")
 
+        playlists = [
+            playlist
+            for playlist in self.playlists
             # Ignore the mirror playlist just cuz its a duplicate of saved tracks
-            if playlist.id == SPOTIFY_MIRROR_PLAYLIST:
-                continue
-
+            if playlist.id != SPOTIFY_MIRROR_PLAYLIST
             # Ignore playlists that are not mine or spoitfys?
-            # if playlist.owner.id not in [self.user.id, "spotify"]:
-            #     continue
-
-            if not playlist.public:
-                continue
-
-            tracks = list(
-                [
-                    track
-                    async for track in self.spotify.playlists.get_tracks(playlist.id)
-                ]
-            )
+            # and playlist.owner.id in [self.user.id, "spotify"]
+            and playlist.public
+        ]
 
-            # Sort by name first so that tracks with the same added_at
-            # will always appear in the same order
-            tracks.sort(key=lambda x: x.track.name)
-            tracks.sort(key=lambda x: x.added_at)
-
-            data = [
-                {
-                    "title": track.track.name,
-                    "album": track.track.album.name,
-                    "artist": ", ".join(artist.name for artist in track.track.artists),
-                    "id": track.track.id,
-                    "url": track.track.url,
-                }
-                for track in tracks
+        # gather keeps the order we hand things in, so the rows still come
+        # out sorted by name no matter which playlist finishes first
+        rows = await asyncio.gather(
+            *[
+                self.export_playlist(playlist, filename)
+                for playlist, filename in zip(playlists, csv_names(playlists))
             ]
+        )
 
-            filename = re.sub(r"[^\w\d\s-]", "_", playlist.name)
-
-            await self.write_csv(os.path.join(_dir, f"playlists/{filename}.csv"), data, fields = ["title", "album", "artist", "id", "url"])
-
-            name = RE_MARKDOWN.sub(r"\\\g<0>", playlist.name)
-            desc = RE_MARKDOWN.sub(r"\\\g<0>", playlist.description)
+        lib_md.extend(rows)
 
-            await lib_md.write(
-                f"|{name}|{playlist.owner.display_name}|{desc}|[open]({playlist.url})|\n"
-            )
+        # whatever is left over is from playlists that are gone now
+        self.output.remove_stale("playlists", "*.csv")
 
         # ================================
         #             ARTISTS
@@ -276,97 +837,207 @@ class DewsBeats:
 
         log.debug("- Artists")
 
-        await lib_md.write("\n")
-        await lib_md.write("## Artists\n\n")
-        await lib_md.write("||Name||\n")
-        await lib_md.write("--- | --- | ---\n")
+        lib_md.append("\n")
+        lib_md.append("## Artists\n\n")
+        lib_md.append("||Name||\n")
+        lib_md.append("--- | --- | ---\n")
 
-        artists = [artist async for artist in self.spotify.follow.get_followed_artist()]
-        artists.sort(key=lambda x: x.name)
+        lib_md.extend(artist.md for artist in self.artists)
 
-        await lib_md.writelines(
-            [
-                f"|<img src='{a.images[-1].url}' height=32>|{a.name}|[open]({a.url})|\n"
-                for a in artists
-            ]
+        await self.write_csv(
+            "Artists.csv",
+            ([artist.name, artist.id, artist.url] for artist in self.artists),
+            ["name", "id", "url"],
         )
 
-        data = [
-            {"name": artist.name, "id": artist.id, "url": artist.url}
-            for artist in artists
-        ]
-
-        await self.write_csv(os.path.join(_dir, "Artists.csv"), data)
-
         # ================================
         #             ALBUMS
         # ================================
 
         log.debug("- Albums")
 
-        await lib_md.write("\n")
-        await lib_md.write("## Albums\n\n")
-        await lib_md.write("||Name|Artists||\n")
-        await lib_md.write("--- | --- | --- | ---\n")
+        lib_md.append("\n")
+        lib_md.append("## Albums\n\n")
+        lib_md.append("||Name|Artists||\n")
+        lib_md.append("--- | --- | --- | ---\n")
 
-        albums = list([a async for a in self.spotify.library.get_albums()])
-        albums.sort(key=lambda x: x.name)
+        lib_md.extend(album.md for album in self.albums)
 
-        await lib_md.writelines(
-            [
-                f"|<img src='{a.images[-1].url}' height=32>|{a.name}|{', '.join([f'[{ar.name}]({ar.url})' for ar in a.artists])}|[open]({a.url})|\n"
-                for a in albums
-            ]
+        await self.write_csv(
+            "Albums.csv",
+            ([album.name, album.artist, album.id, album.url] for album in self.albums),
+            ["name", "artist", "id", "url"],
         )
 
-        data = [
-            {
-                "name": album.name,
-                "artist": ", ".join(artist.name for artist in album.artists),
-                "id": album.id,
-                "url": album.url,
-            }
-            for album in albums
-        ]
+        await self.output.write("LIBRARY.md", "".join(lib_md))
+
+        self.output.save()
 
-        await self.write_csv(os.path.join(_dir, "Albums.csv"), data)
+    async def export_playlist(self, playlist, filename: str) -> str:
+        async with self._export_slots:
+            log.debug(f"- Playlist {playlist.name}")
 
-        await lib_md.close()
+            tracks = spotify.TrackTable.from_tracks(
+                await self.playlist_cache.get_tracks(
+                    self.spotify.playlists, playlist, concurrency=SPOTIFY_CONCURRENCY
+                )
+            )
 
-    async def write_csv(self, file, data: List, fields: List = None):
-        async with aiofiles.open(file, "w") as f:
-            if not fields:
-                fields = list(data[0].keys())
+            # order() sorts by name as well so that tracks with the same
+            # added_at will always appear in the same order
+            await self.write_csv(
+                f"playlists/{filename}.csv",
+                tracks.csv_rows(tracks.order()),
+                TRACK_FIELDS,
+            )
 
-            await f.write(make_csv(fields) + "\n")
+        name = RE_MARKDOWN.sub(r"\\\g<0>", playlist.name)
+        desc = RE_MARKDOWN.sub(r"\\\g<0>", playlist.description)
 
-            await f.writelines([f"{make_csv(list(l.values()))}\n" for l in data])
+        return f"|{name}|{playlist.owner.display_name}|{desc}|[open]({playlist.url})|\n"
 
-    async def update_playlist(self):
-        playlist_tracks: List[str] = [
-            track.track.uri
-            async for track in self.spotify.playlists.get_tracks(
-                SPOTIFY_MIRROR_PLAYLIST  # , fields="items(track(uri))
+    async def get_artists(self):
+        # only keep what ends up in the export, sorted by name
+        self.artists = [
+            ArtistRow(
+                artist.name,
+                artist.id,
+                artist.url,
+                f"|<img src='{artist.images[-1].url}' height=32>|{artist.name}|[open]({artist.url})|\n",
             )
+            async for artist in self.spotify.follow.get_followed_artist()
         ]
+        self.artists.sort(key=lambda x: x.name)
+
+    async def get_albums(self):
+        self.albums = [
+            AlbumRow(
+                a.name,
+                ", ".join(artist.name for artist in a.artists),
+                a.id,
+                a.url,
+                f"|<img src='{a.images[-1].url}' height=32>|{a.name}|{', '.join([f'[{ar.name}]({ar.url})' for ar in a.artists])}|[open]({a.url})|\n",
+            )
+            async for a in self.spotify.library.get_albums(
+                concurrency=SPOTIFY_CONCURRENCY
+            )
+        ]
+        self.albums.sort(key=lambda x: x.name)
+
+    async def write_csv(
+        self, path, rows: Union[Iterable, AsyncIterable], fields: List[str]
+    ):
+        await self.output.write_stream(path, csv_chunks(fields, rows))
+
+    async def update_playlist(self):
+        mirror = next(
+            (pl for pl in self.playlists if pl.id == SPOTIFY_MIRROR_PLAYLIST), None
+        )
+
+        if mirror:
+            current = await self.playlist_cache.get_tracks(
+                self.spotify.playlists,
+                mirror,
+                projection=MIRROR_PROJECTION,
+                concurrency=SPOTIFY_CONCURRENCY,
+            )
+        else:
+            current = [
+                track
+                async for track in self.spotify.playlists.get_tracks(
+                    SPOTIFY_MIRROR_PLAYLIST,
+                    projection=MIRROR_PROJECTION,
+                    concurrency=SPOTIFY_CONCURRENCY,
+                )
+            ]
+
+        diff = spotify.PlaylistDiff(
+            (track.track.uri for track in self.library.iter(MIRROR_PROJECTION)),
+            (track.track.uri for track in current),
+        )
+
+        if not diff:
+            log.debug("Mirror playlist is up to date")
+            return
+
+        await diff.apply(self.spotify.playlists, SPOTIFY_MIRROR_PLAYLIST)
 
-        new_tracks: List[str] = []
+        added = sum(len(insert.uris) for insert in diff.inserts)
 
-        for track in self.saved_tracks:
-            if track.track.uri not in playlist_tracks:
-                new_tracks.append(track.track.uri)
+        log.debug(
+            f"Updated mirror playlist in {diff.calls} call(s) "
+            f"({added} added, {len(diff.remove)} removed)"
+        )
+
+    def write_report(self):
+        extra = {}
+
+        if self.pipeline:
+            stages = self.metrics.stages
+            path = self.pipeline.critical_path(stages)
+
+            extra["critical_path"] = [
+                {"stage": name, "seconds": round(stages[name][1] - stages[name][0], 6)}
+                for name in path
+            ]
+            extra["failed"] = {name: repr(e) for name, e in self.pipeline.failed.items()}
+            extra["skipped"] = self.pipeline.skipped
+
+        if self.profiler:
+            extra["profile"] = self.profiler.report()
+
+        report = self.metrics.report(**extra)
+
+        log.info(
+            f"Run took {report['seconds']:.1f}s, "
+            f"{sum(e['requests'] for e in report['endpoints'].values())} request(s)"
+        )
+
+        if extra.get("critical_path"):
+            log.info(
+                "Critical path: "
+                + " -> ".join(
+                    f"{stage['stage']} {stage['seconds']:.1f}s"
+                    for stage in extra["critical_path"]
+                )
+            )
+
+        os.makedirs(os.path.dirname(METRICS_REPORT) or ".", exist_ok=True)
 
-        await self.spotify.playlists.add_tracks(SPOTIFY_MIRROR_PLAYLIST, new_tracks)
+        with open(METRICS_REPORT, "a") as f:
+            f.write(json.dumps(report) + "\n")
 
-        log.debug(f"Added {len(new_tracks)} new tracks to mirror playlist")
+        if METRICS_PROMETHEUS:
+            # moved into place whole, so a scrape never sees half of it
+            with open(f"{METRICS_PROMETHEUS}.tmp", "w") as f:
+                f.write(self.metrics.prometheus())
+
+            os.replace(f"{METRICS_PROMETHEUS}.tmp", METRICS_PROMETHEUS)
 
     async def close(self):
-        pass
-        # await self.client.close()
-        # await self.user.http.close()
+        if self.git:
+            await self.git.close()
+
+        self.library.close()
+        self.playlist_cache.close()
+        await self.spotify.api.close_client()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="cProfile the run and watch for a blocked event loop",
+    )
+    parser.add_argument(
+        "--lag-threshold",
+        type=float,
+        default=0.1,
+        help="seconds the loop can be blocked before --profile complains",
+    )
+    args = parser.parse_args()
+
     loop = asyncio.new_event_loop()
-    d = DewsBeats()
+    d = DewsBeats(profile=args.profile, lag_threshold=args.lag_threshold)
     loop.run_until_complete(d.main())